@@ -1,39 +1,111 @@
-import time
-import random
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
+import re
 from bs4 import BeautifulSoup
+import metrics
+from browser import BrowserSession
+from fetcher import Fetcher
+from pacing import AdaptivePacer
 
 # --- 設定（ここを変更してください） ---
-TARGET_EXAM = "cis-csm"       # 検索したい試験名（リンク文字に含まれるもの）
+# 収集したい試験名（リンク文字に含まれるもの）。1回の巡回で全試験分をまとめて振り分けます
+# 例: ["cis-csm", "cis-itsm", "cis-hr", "csa", "cad"]
+TARGET_EXAMS = ["cis-csm"]
 CATEGORY_NAME = "servicenow"  # URLの一部 (discussions/servicenow/)
 MAX_PAGE = 150                 # https://www.examtopics.com/discussions/servicenow/ の最大ページ数
-OUTPUT_FILENAME = f'ServiceNow_{TARGET_EXAM}_links.txt'
+OUTPUT_FILENAME_TEMPLATE = 'ServiceNow_{exam}_links.txt'  # 試験ごとの出力先 ({exam} は大文字の試験名)
+FETCH_ENGINE = 'auto'          # 'auto' = HTTPで取得しチャレンジページだけChrome / 'http' / 'selenium' = 従来どおりChromeのみ
+# アクセス間隔は応答に合わせて自動調整する（成功が続けば縮め、チャレンジページやエラーが出たら広げる）
+PACING_MIN_INTERVAL = 2.5      # ページ取得の間隔の下限（秒）。これより速くはしない
+PACING_MAX_INTERVAL = 60.0     # 間隔の上限（秒）
+PACING_START_INTERVAL = 8.0    # 学習結果がない時の最初の間隔（秒）
+PACING_STATE_FILE = '.cache/pacing.json'  # 学習した間隔の保存先（02 と共有し、次回に引き継ぐ）
+DISCOVERY_MODE = 'incremental' # 'incremental' = 既存リストとの差分だけ収集 / 'full' = 全ページを巡回
+STOP_AFTER_KNOWN_PAGES = 3     # 差分モードで、新規リンクのないページが何回続いたら打ち切るか
+                               # （対象試験のリンクがまばらなカテゴリでは大きめにしてください）
+LIVE_PROGRESS = False          # True = 進捗と残り時間の目安を1行で表示し続ける
+RUN_REPORT_FILE = '.cache/reports/01_fetch_urls.json'  # 取得・解析などにかかった時間の内訳（JSON）
+BROWSER_STATE_DIR = '.cache/browser'  # Chromeのプロフィール・Cookie・ドライバーの場所の保存先（02 と共有）
+BROWSER_KEEP_ALIVE = True      # True = 終了時にChromeを閉じずに残し、続けて実行する 02 がそのまま使い回す
 # ----------------------------------
 
-def init_driver():
-    options = webdriver.ChromeOptions()
-    # MacのChromeの場所
-    options.binary_location = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
-    
-    # ステルス設定（Cloudflare回避）
-    options.add_argument('--disable-blink-features=AutomationControlled')
-    options.add_argument('--no-sandbox')
-    options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
-    
-    driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    return driver
+def output_filename(exam):
+    return OUTPUT_FILENAME_TEMPLATE.format(exam=exam.upper())
+
+def load_known_links(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if "http" in line}
+
+def build_exam_patterns(exams):
+    # "cis-hr" が "cis-hrsd" に、"csa" が "cis-csa" に誤って一致しないよう、前後が英数字やハイフンでないことを条件にする
+    patterns = {}
+    for exam in exams:
+        patterns[exam] = re.compile(r'(?<![\w-])' + re.escape(exam.lower()) + r'(?![\w-])')
+    return patterns
+
+def match_exam(link_text, patterns):
+    # 複数の試験名に一致する場合は、一番長い（より具体的な）試験名に振り分ける
+    text = link_text.lower()
+    matched = [exam for exam, pattern in patterns.items() if pattern.search(text)]
+    return max(matched, key=len) if matched else None
+
+def extract_exam_links(page_source, patterns):
+    # ページ内の discussion-link を試験ごとに振り分けて返す {試験名: [URL, ...]}
+    with metrics.timer('parse.listing'):
+        soup = BeautifulSoup(page_source, 'html.parser')
 
-def main():
+        # リンクを取得 (class="discussion-link" を探す)
+        elements = soup.find_all('a', class_='discussion-link')
+
+        links = {exam: [] for exam in patterns}
+        for element in elements:
+            link_text = element.get_text().strip()
+            link_href = element.get('href')
+            if not link_href:
+                continue
+
+            # どの試験のリンクかチェック
+            exam = match_exam(link_text, patterns)
+            if exam:
+                # 相対パスなら絶対パスに変換
+                if not link_href.startswith('http'):
+                    link_href = "https://www.examtopics.com" + link_href
+
+                links[exam].append(link_href)
+        return links
+
+def main(browser=None, pacer=None, on_new_links=None):
+    # run_all.py から呼ぶ時は Chrome とアクセス間隔を 02 と共有し（閉じるのは呼び出し側）、
+    # 新しく見つけたリンクを見つけた時点で on_new_links(試験名, [URL, ...]) に渡す（02 の取得を先に始められる）
+    metrics.REGISTRY.reset()
+    shared_browser = browser is not None
     base_url = f'https://www.examtopics.com/discussions/{CATEGORY_NAME}/'
-    all_links = []
+    patterns = build_exam_patterns(TARGET_EXAMS)
+    all_links = {exam: set() for exam in TARGET_EXAMS}
+
+    # 差分モード: 既存のURLリストを読み込み、新しい順（1ページ目から）に見て
+    # どの試験にも新規リンクのないページが STOP_AFTER_KNOWN_PAGES 回続いたら打ち切る
+    known_links = {exam: set() for exam in TARGET_EXAMS}
+    if DISCOVERY_MODE == 'incremental':
+        for exam in TARGET_EXAMS:
+            known_links[exam] = load_known_links(output_filename(exam))
+    # 既存リストがない試験が1つでもあれば、その試験のために全ページを巡回する
+    incremental = DISCOVERY_MODE == 'incremental' and all(os.path.exists(output_filename(exam)) for exam in TARGET_EXAMS)
 
-    print(f"試験「{TARGET_EXAM}」のURL収集を開始します（全{MAX_PAGE}ページ）...")
+    exam_names = ", ".join(TARGET_EXAMS)
+    if incremental:
+        known_count = sum(len(links) for links in known_links.values())
+        print(f"試験「{exam_names}」のURL差分収集を開始します（既知 {known_count} 件 / 新規なしが {STOP_AFTER_KNOWN_PAGES} ページ続いたら終了）...")
+    else:
+        print(f"試験「{exam_names}」のURL収集を開始します（全{MAX_PAGE}ページ）...")
     
-    driver = init_driver()
+    # Chromeはチャレンジページが出た時だけ起動される（前回残したChromeがあればそれに接続する）
+    pacer = pacer or AdaptivePacer(PACING_MIN_INTERVAL, PACING_MAX_INTERVAL, PACING_START_INTERVAL, PACING_STATE_FILE)
+    browser = browser or BrowserSession(BROWSER_STATE_DIR, keep_alive=BROWSER_KEEP_ALIVE)
+    fetcher = Fetcher(FETCH_ENGINE, browser, pacer=pacer)
+    known_streak = 0
+    progress = metrics.Progress(MAX_PAGE, "巡回", LIVE_PROGRESS)
 
     try:
         # ページを1から順に巡回
@@ -42,47 +114,65 @@ def main():
             print(f"[{page}/{MAX_PAGE}] アクセス中: {target_url}")
             
             try:
-                driver.get(target_url)
+                page_source, _ = fetcher.fetch(target_url)
                 
-                # ページ読み込み＆ブロック回避のための待機
-                time.sleep(random.uniform(5, 8))
+                page_links = extract_exam_links(page_source, patterns)
+                found_count = 0
+                new_count = 0
+                for exam, links in page_links.items():
+                    new_links = set(links) - known_links[exam] - all_links[exam]
+                    all_links[exam].update(links)
+                    found_count += len(links)
+                    new_count += len(new_links)
+                    if on_new_links and new_links:
+                        on_new_links(exam, sorted(new_links))
                 
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                
-                # リンクを取得 (class="discussion-link" を探す)
-                elements = soup.find_all('a', class_='discussion-link')
-                
-                count_in_page = 0
-                for element in elements:
-                    link_text = element.get_text().strip()
-                    link_href = element.get('href')
-                    
-                    # 試験名が含まれているかチェック
-                    if TARGET_EXAM.lower() in link_text.lower() and link_href:
-                        # 相対パスなら絶対パスに変換
-                        if not link_href.startswith('http'):
-                            link_href = "https://www.examtopics.com" + link_href
-                        
-                        all_links.append(link_href)
-                        count_in_page += 1
-                
-                print(f"  -> {count_in_page} 件のリンクを発見")
+                print(f"  -> {found_count} 件のリンクを発見（うち新規 {new_count} 件）")
+                metrics.count('pages.fetched')
+                metrics.count('links.found', found_count)
+                metrics.count('links.new', new_count)
 
             except Exception as e:
+                # 取得に失敗したページは「新規なし」に数えない
                 print(f"  -> エラー: {e}")
+                metrics.count('pages.error')
+                continue
+            finally:
+                progress.update()
 
-    finally:
-        driver.quit()
+            if incremental:
+                known_streak = 0 if new_count else known_streak + 1
+                if known_streak >= STOP_AFTER_KNOWN_PAGES:
+                    print(f"  -> 新規リンクのないページが {known_streak} 回続いたため終了します。")
+                    break
 
-    # 重複を除去して保存
-    unique_links = sorted(list(set(all_links)))
-    
-    with open(OUTPUT_FILENAME, 'w', encoding='utf-8') as f:
-        for link in unique_links:
-            f.write(link + '\n')
+    finally:
+        fetcher.close()
+        if not shared_browser:
+            browser.close()
+        progress.close()
+        pacer.save()
 
     print(f"\n🎉 完了しました！")
-    print(f"合計 {len(unique_links)} 件のURLを '{OUTPUT_FILENAME}' に保存しました。")
+    print(pacer.summary())
+
+    # 試験ごとに既知のリンクとマージし、重複を除去して保存
+    for exam in TARGET_EXAMS:
+        unique_links = sorted(known_links[exam] | all_links[exam])
+        added_count = len(unique_links) - len(known_links[exam])
+        filename = output_filename(exam)
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            for link in unique_links:
+                f.write(link + '\n')
+
+        print(f"[{exam}] 新規 {added_count} 件 / 合計 {len(unique_links)} 件のURLを '{filename}' に保存しました。")
+
+    report = metrics.REGISTRY.write_report(RUN_REPORT_FILE, '01_fetch_urls', {
+        'exams': TARGET_EXAMS, 'mode': 'incremental' if incremental else 'full', 'engine': FETCH_ENGINE,
+    })
+    print("\n".join(metrics.summary_lines(report)))
+    print(f"📝 実行レポート: {RUN_REPORT_FILE}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
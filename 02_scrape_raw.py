@@ -1,36 +1,34 @@
-import time
-import random
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+from browser import BrowserSession
+from fetcher import Fetcher
+from pacing import AdaptivePacer
+from page_cache import PageCache, STATUS_OK, STATUS_EMPTY
+from question_parser import make_soup, parse_card_html, prune_tree, write_question_store
 
 # --- 設定 ---
 INPUT_FILE = 'ServiceNow_CIS-CSM_links.txt'
 OUTPUT_FILE = 'CIS-CSM_Complete_Questions.html' # 完成版のファイル名
+QUESTIONS_FILE = 'CIS-CSM_Questions.jsonl'     # 問題ごとの構造化データ（03 はこちらを直接読み込む）
+FETCH_ENGINE = 'auto'      # 'auto' = HTTPで取得しチャレンジページだけChrome / 'http' / 'selenium' = 従来どおりChromeのみ
+WORKERS = 3                # 同時に取得するワーカー数（Chromeは必要になった時だけ、ワーカーごとに起動する）
+# 同一ホストへのアクセス間隔（全ワーカー合計）は応答に合わせて自動調整する（成功が続けば縮め、チャレンジページやエラーが出たら広げる）
+PACING_MIN_INTERVAL = 2.5  # 間隔の下限（秒）。これより速くはしない
+PACING_MAX_INTERVAL = 60.0 # 間隔の上限（秒）
+PACING_START_INTERVAL = 8.0  # 学習結果がない時の最初の間隔（秒）
+PACING_STATE_FILE = '.cache/pacing.json'  # 学習した間隔の保存先（01 と共有し、次回に引き継ぐ）
+CACHE_DIR = '.cache/pages' # 取得済みページの保存先（再実行時はここから読むのでブラウザを使わない）
+CACHE_TTL_DAYS = None      # None = キャッシュは期限なし / 数値 = その日数より古いページは取り直す
+FORCE_REFRESH = False      # True = キャッシュを無視して全ページ取り直す
+HTML_PARSER = 'auto'       # 'auto' = lxml があれば lxml（速い）/ 'lxml' / 'html.parser' = 従来の標準パーサー
+LIVE_PROGRESS = False      # True = 進捗と残り時間の目安を1行で表示し続ける
+RUN_REPORT_FILE = '.cache/reports/02_scrape_raw.json'  # 取得・解析などにかかった時間の内訳（JSON）
+BROWSER_STATE_DIR = '.cache/browser'  # Chromeのプロフィール・Cookie・ドライバーの場所の保存先（01 と共有）
+BROWSER_KEEP_ALIVE = False # True = 終了時にChromeを閉じずに残す（01 が残したChromeはここで使い回して閉じる）
 # ------------
 
-def init_driver():
-    options = webdriver.ChromeOptions()
-    # MacのChromeの場所
-    options.binary_location = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
-    
-    # 成功したステルス設定（ロボット検知回避）
-    options.add_argument('--disable-blink-features=AutomationControlled')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    options.add_experimental_option('useAutomationExtension', False)
-    options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
-    
-    driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-    
-    # WebDriverであることを隠すJavascript
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    
-    return driver
-
 def create_html_header():
     return """
     <html>
@@ -62,64 +60,44 @@ def create_html_header():
     <h1>ServiceNow CIS-CSM Exam Questions (Full)</h1>
     """
 
-def main():
-    if not os.path.exists(INPUT_FILE):
-        print(f"エラー: {INPUT_FILE} が見つかりません。")
-        return
+# ページから取り除く要素（ボタン、スクリプト、スタイル、投票エリア、Show Answerボタンなど）
+UNWANTED_TAGS = {'script', 'style', 'button', 'form'}
+UNWANTED_CLASSES = {'btn', 'reveal-solution', 'hide-solution', 'voted-answers-tally'}
 
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f if "http" in line]
-    except Exception as e:
-        print(f"ファイル読み込みエラー: {e}")
-        return
+def is_unwanted(tag):
+    return tag.name in UNWANTED_TAGS or not UNWANTED_CLASSES.isdisjoint(tag.get('class') or ())
 
-    print(f"全 {len(urls)} 件の処理を開始します。これには時間がかかります...")
-    print("Chromeが起動したら、基本的には放置でOKです。")
-    print("（もし万が一『人間ですか？』が出たらクリックしてください）")
-    
-    driver = init_driver()
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as out:
-        out.write(create_html_header())
-        
-        for index, url in enumerate(urls):
-            print(f"[{index + 1}/{len(urls)}] 取得中... {url}")
-            
-            try:
-                driver.get(url)
-                
-                # サーバー負荷とブロック回避のため、少し長めにランダム待機
-                time.sleep(random.uniform(5, 8))
-                
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                
-                # コンテンツの抽出
-                question_body = soup.find('div', class_='discussion-header-container')
-                
-                if not question_body:
-                    # サブプラン：クラス名が違う場合
-                    bodies = soup.find_all('div', class_='card-body')
-                    for b in bodies:
-                        if len(b.text) > 50:
-                            question_body = b
-                            break
-                
-                q_html = ""
-                if question_body:
-                    # 不要な要素（ボタン、スクリプト、スタイル、投票エリアなど）を削除
-                    for unwanted in question_body.find_all(['script', 'style', 'button', 'form']):
-                        unwanted.decompose()
-                    
-                    # 特定のクラスを持つ不要要素を削除（Show Answerボタンなど）
-                    for hidden in question_body.find_all(class_=['btn', 'reveal-solution', 'hide-solution', 'voted-answers-tally']):
-                        hidden.decompose()
-
-                    q_html = str(question_body)
-                else:
-                    q_html = f"<p class='error'>問題文を取得できませんでした (Link: {url})</p>"
-
-                out.write(f"""
+def extract_question_html(page_source):
+    with metrics.timer('parse.page'):
+        soup = make_soup(page_source, HTML_PARSER)
+
+        # コンテンツの抽出
+        question_body = soup.find('div', class_='discussion-header-container')
+
+        if not question_body:
+            # サブプラン：クラス名が違う場合
+            bodies = soup.find_all('div', class_='card-body')
+            for b in bodies:
+                if len(b.text) > 50:
+                    question_body = b
+                    break
+
+        if not question_body:
+            return None
+
+        # 不要な要素を1回の走査でまとめて削除
+        prune_tree(question_body, is_unwanted)
+
+        return str(question_body)
+
+def read_urls(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if "http" in line]
+
+def build_card_html(index, url, q_html):
+    if q_html is None:
+        q_html = f"<p class='error'>問題文を取得できませんでした (Link: {url})</p>"
+    return f"""
                 <div class="question-card">
                     <div class="q-header">
                         <span>Question {index + 1}</span>
@@ -127,19 +105,152 @@ def main():
                     <div class="q-text">{q_html}</div>
                     <a href="{url}" class="source-link" target="_blank">Open Original Page</a>
                 </div>
-                """)
-                out.flush() 
+                """
 
-            except Exception as e:
-                print(f"  >> エラー: {e}")
-                # エラーが起きてもHTMLレイアウトが崩れないように空のカードを入れる
-                out.write(f"<div class='question-card'><p class='error'>Error processing: {url}</p></div>")
-            
-    with open(OUTPUT_FILE, 'a', encoding='utf-8') as out:
-        out.write("</body></html>")
+def build_error_card(url):
+    # エラーが起きてもHTMLレイアウトが崩れないように空のカードを入れる
+    return f"<div class='question-card'><p class='error'>Error processing: {url}</p></div>"
+
+class ScrapePool:
+    # ワーカー（スレッド）ごとに1つの Fetcher（HTTP接続と Chrome）を持たせて並列に取得する
+    # 最初のワーカーは渡された Chrome（browser.BrowserSession。01 が残した Chrome など）を使い、
+    # 他のワーカーは自分専用の Chrome（browser.worker_session()）を使うので、Chrome での取得も同時に進む
+    def __init__(self, workers, pacer, cache, engine, browser):
+        self.workers = workers
+        self.pacer = pacer
+        self.cache = cache
+        self.engine = engine
+        self.browser = browser
+        self.local = threading.local()
+        self.fetchers = []
+        self.sessions = []  # このプールが作ったワーカー用の Chrome（閉じるのもこのプール）
+        self.lock = threading.Lock()
+
+    def get_fetcher(self):
+        fetcher = getattr(self.local, 'fetcher', None)
+        if fetcher is None:
+            with self.lock:
+                index = len(self.fetchers)
+                browser = self.browser
+                if index > 0 and self.engine != 'http':
+                    browser = self.browser.worker_session(index)
+                    self.sessions.append(browser)
+                fetcher = Fetcher(self.engine, browser, pacer=self.pacer)
+                self.fetchers.append(fetcher)
+            self.local.fetcher = fetcher
+        return fetcher
+
+    def fetch(self, index, url):
+        # 取得済み（キャッシュが新しい）ならブラウザを使わずにそのまま使う
+        if self.cache.is_fresh(url):
+            page_source = self.cache.get(url)
+            if page_source is not None:
+                metrics.count('pages.cache_hit')
+                return build_card_html(index, url, extract_question_html(page_source)), True
+
+        fetcher = self.get_fetcher()
+        try:
+            page_source, _ = fetcher.fetch(url)
+        except Exception as e:
+            metrics.count('pages.error')
+            self.cache.mark_error(url, e)
+            raise
+
+        metrics.count('pages.fetched')
+        q_html = extract_question_html(page_source)
+        if q_html is None:
+            metrics.count('pages.empty')
+        self.cache.put(url, page_source, STATUS_OK if q_html is not None else STATUS_EMPTY)
+        return build_card_html(index, url, q_html), False
+
+    def run(self, urls):
+        # 取得はバラバラの順番で終わるが、カードは必ず URL リストの順番で返す
+        pending = {}
+        next_index = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.fetch, i, url): i for i, url in enumerate(urls)}
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                index = futures[future]
+                url = urls[index]
+                try:
+                    pending[index], from_cache = future.result()
+                    source = "キャッシュ" if from_cache else "取得完了"
+                    print(f"[{done_count}/{len(urls)}] {source} (Question {index + 1}) {url}")
+                except Exception as e:
+                    print(f"  >> エラー (Question {index + 1}): {e}")
+                    pending[index] = build_error_card(url)
+
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+
+    def close(self):
+        # 渡された Chrome（self.browser）は閉じない（共有しているので呼び出し側で閉じる）
+        for fetcher in self.fetchers:
+            fetcher.close()
+        for session in self.sessions:
+            session.close()
+
+def main(browser=None, pacer=None):
+    # run_all.py から呼ぶ時は 01 と同じ Chrome とアクセス間隔を使う（Chrome を閉じるのは呼び出し側）
+    metrics.REGISTRY.reset()
+    shared_browser = browser is not None
+    if not os.path.exists(INPUT_FILE):
+        print(f"エラー: {INPUT_FILE} が見つかりません。")
+        return
+
+    try:
+        urls = read_urls(INPUT_FILE)
+    except Exception as e:
+        print(f"ファイル読み込みエラー: {e}")
+        return
+
+    cache = PageCache(CACHE_DIR, ttl_days=CACHE_TTL_DAYS, force_refresh=FORCE_REFRESH)
+    cached_count, fetch_count = cache.summary(urls)
+
+    workers = max(1, min(WORKERS, fetch_count))
+    print(f"全 {len(urls)} 件の処理を開始します（キャッシュ済み {cached_count} 件 / 新規取得 {fetch_count} 件）。")
+    if fetch_count:
+        print(f"{workers} ワーカーで並列取得します（取得エンジン: {FETCH_ENGINE}）。これには時間がかかります...")
+        if FETCH_ENGINE != 'http':
+            print("Chromeが起動したら、基本的には放置でOKです。")
+            print("（もし万が一『人間ですか？』が出たらクリックしてください）")
+
+    pacer = pacer or AdaptivePacer(PACING_MIN_INTERVAL, PACING_MAX_INTERVAL, PACING_START_INTERVAL, PACING_STATE_FILE)
+    browser = browser or BrowserSession(BROWSER_STATE_DIR, keep_alive=BROWSER_KEEP_ALIVE)
+    pool = ScrapePool(workers, pacer, cache, FETCH_ENGINE, browser)
+
+    records = []
+    progress = metrics.Progress(len(urls), "取得", LIVE_PROGRESS)
+    try:
+        with open(OUTPUT_FILE, 'w', encoding='utf-8') as out:
+            out.write(create_html_header())
+
+            for card_html in pool.run(urls):
+                out.write(card_html)
+                out.flush()
+                records.append(parse_card_html(card_html, HTML_PARSER))
+                progress.update()
+
+            out.write("</body></html>")
+    finally:
+        pool.close()
+        if not shared_browser:
+            browser.close()
+        progress.close()
+        pacer.save()
+
+    # HTMLを書き終えた後に保存する（ストアの方が新しい＝HTMLと内容が一致している目印）
+    write_question_store(QUESTIONS_FILE, records)
+
+    print(f"\n完了しました！ '{OUTPUT_FILE}' と '{QUESTIONS_FILE}' を確認してください。")
+    print(pacer.summary())
 
-    driver.quit()
-    print(f"\n完了しました！ '{OUTPUT_FILE}' を確認してください。")
+    report = metrics.REGISTRY.write_report(RUN_REPORT_FILE, '02_scrape_raw', {
+        'urls': len(urls), 'cached': cached_count, 'to_fetch': fetch_count, 'workers': workers, 'engine': FETCH_ENGINE,
+    })
+    print("\n".join(metrics.summary_lines(report)))
+    print(f"📝 実行レポート: {RUN_REPORT_FILE}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
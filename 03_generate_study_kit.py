@@ -1,34 +1,97 @@
 from google import genai
-from bs4 import BeautifulSoup
+from google.genai import types
+from collections import deque
+from functools import partial
+from itertools import chain
 from deep_translator import GoogleTranslator
-import re
+import hashlib
+import inspect
+import json
 import os
-import time
+import re
 from dotenv import load_dotenv
+from question_parser import UNKNOWN_NUM, is_store_fresh, iter_card_html, parse_card_html, read_question_store
+from translation_memory import TranslationMemory
+from ai_cache import AICache
+from ai_scheduler import AIScheduler, ModelLimiter, generate_with_backoff
+from gemini_batch import BatchRunner, GeminiBatchBackend, LocalBatchBackend
+from textbook_writer import CardSpool, PagedSpool
+from pipeline import CpuPool, Stage, run_pipeline
+from fragment_cache import FragmentCache
+from search_index import SearchIndex, card_entry, index_path, search_panel
+from notebook_writer import NotebookWriter
+from dedup import find_duplicates
+from model_probe import select_model
+import question_parser
+import search_index
+import metrics
 
 # --- 設定エリア ---
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 
 INPUT_FILE = 'CIS-CSM_Complete_Questions.html'
+QUESTIONS_FILE = 'CIS-CSM_Questions.jsonl'  # 02 が出力する構造化データ（あればHTMLより優先）
+TRANSLATION_MEMORY_FILE = '.cache/translations.json'  # 翻訳済みの文の保存先（翻訳済みの文は再翻訳しない）
+AI_CACHE_FILE = '.cache/ai_answers.json'  # AI解説の保存先（問題文・プロンプト・モデルが同じならAPIを呼ばない）
+AI_CACHE_PRUNE = False                     # True = 今のプロンプト・モデルでは使われない古い解説を削除する
 OUTPUT_HTML = 'CIS-CSM_Master_Textbook_AI_test.html' 
+# 'single' = 全問を1つのHTMLに書く / 'paged' = 小さな枠のHTML＋ページごとのデータファイル（スクロールに合わせて読み込む。問題数が多い時向け）
+OUTPUT_MODE = 'single'
+PAGE_SIZE = 50  # 'paged' で1ページ（1データファイル）に入れる問題数
+SEARCH_INDEX = True  # True = 検索用の索引（<出力ファイル名>_search.js）を作り、教科書に検索欄を付ける
+NOTEBOOK_FILE = 'CIS-CSM_My_Notebook.xlsx'  # 記録用のExcelノート（None = 作らない）。「自分の結論」「メモ」の列は再生成しても消えない
+NOTEBOOK_STATE_FILE = '.cache/notebook_state.json'  # ノートの各行の内容ハッシュと位置（変わった問題の行だけ書き換える）
+DEDUP = True             # True = 同じ問題の別スレッドを1問にまとめ、投票を足し合わせる（翻訳・AI解説は1回だけ）
+DEDUP_THRESHOLD = 0.85   # 問題文＋選択肢の一致度（3語ずつの Jaccard 係数）がこれ以上なら同じ問題とみなす
+DEDUP_RECORDS_FILE = '.cache/dedup_records.jsonl'  # HTMLから読む場合、重複探しで解析したレコードを本処理に渡す一時ファイル
 MODEL_ID = 'models/gemini-2.5-pro' 
+# MODEL_ID = 'auto' にすると、起動時に model_probe.CANDIDATES から一番速く使えるモデルを選ぶ
+# （find_model.py と同じ確認結果を使い、MODEL_PROBE_FILE の結果が新しければAPIに問い合わせない）
+MODEL_PROBE_FILE = '.cache/model_probe.json'
 
 # 'ALL':全問, 'SPLIT_ONLY':意見割れのみ, 'NONE':翻訳のみ
 AI_TARGET_MODE = 'SPLIT_ONLY' 
 TEST_LIMIT = 10  # None = 全問処理, 数値 = 問題数制限
+AI_MAX_CONCURRENCY = 4  # AI解説の同時リクエスト数
+STREAM_CHUNK = 50        # この問題数ずつ 読み込み→まとめ翻訳→出力 を繰り返す
+MAX_PENDING_CARDS = 100  # AI解説の応答待ちでメモリに置いておくカードの上限
+# モデルごとの上限（RPM/TPM）の上書き。未指定のモデルは ai_scheduler.MODEL_LIMITS の値を使う
+# 例: {'models/gemini-2.5-pro': {'rpm': 150, 'tpm': 2000000}}
+AI_RATE_LIMITS = {}
+
+# 'sync' = 問題ごとにAPIへ送る / 'batch' = Geminiのバッチモードで全問まとめて1つのジョブとして投入（全問処理向け）
+AI_RUN_MODE = 'sync'
+AI_BATCH_WAIT = False          # True = ジョブの完了まで待つ / False = 投入だけして、結果は次回の実行で取り込む
+AI_BATCH_POLL_INTERVAL = 60    # ジョブの状態を確認する間隔（秒）
+AI_BATCH_STATE_FILE = '.cache/ai_batch_state.json'      # 実行中のジョブの情報（これがあれば次回は続きから待つ）
+AI_BATCH_JOB_FILE = '.cache/ai_batch_requests.jsonl'    # 投入するリクエストのファイル
+AI_BATCH_RESULTS_FILE = 'CIS-CSM_AI_Batch_Results.jsonl'  # ジョブの結果（問題番号つき。後の実行でオフラインにマージできる）
+AI_BATCH_PENDING_TEXT = "(バッチ処理中のため、AI解説は次回の実行で反映されます)"
+
+# 'parallel' = 解析(別プロセス)・翻訳・AI解説を段ごとのワーカーで同時に進める / 'serial' = 1問ずつ順に処理（出力は同じ）
+PIPELINE_MODE = 'parallel'
+PARSE_WORKERS = None     # HTML解析のプロセス数（None = CPUコア数）
+TRANSLATE_WORKERS = 2    # 翻訳のスレッド数
+PIPELINE_QUEUE_SIZE = 32 # 段と段の間に溜めておく問題数の上限（下流が詰まると上流が待つ）
+HTML_PARSER = 'auto'     # 'auto' = lxml があれば lxml（速い）/ 'lxml' / 'html.parser' = 従来の標準パーサー
+LIVE_PROGRESS = False    # True = 進捗と残り時間の目安を1行で表示し続ける
+RUN_REPORT_FILE = '.cache/reports/03_generate_study_kit.json'  # 解析・翻訳・AI解説などにかかった時間の内訳（JSON）
+FRAGMENT_CACHE_DIR = '.cache/fragments'  # 描画済みカードの保存先（問題・設定・描画処理が変わっていないカードは作り直さない）
+INCREMENTAL_BUILD = True                 # False = 保存済みのカードを使わず全問作り直す（保存はし直す）
 # ------------------
 
 def init_client():
     if not API_KEY:
         print("⚠️ エラー: .envファイルまたはAPIキーが見つかりません。")
         return None
+    # ローカルの代役サーバー（fake_gemini.py）を使う場合は GEMINI_BASE_URL を指定する
+    base_url = os.getenv("GEMINI_BASE_URL")
+    if base_url:
+        return genai.Client(api_key=API_KEY, http_options=types.HttpOptions(base_url=base_url))
     return genai.Client(api_key=API_KEY)
 
-def get_ai_answer(client, question_text):
-    if not client: return "API未設定"
-    
-    prompt = f"""
+PROMPT_TEMPLATE = """
     あなたはServiceNowのエキスパート(CIS-CSM認定資格保持者)です。
     以下の「英語の試験問題」について、サイトの正解とコミュニティの投票が割れています。
     どちらが正しいか、あるいは問題自体が古いのか、論理的に正解を導き出し解説してください。
@@ -44,186 +107,243 @@ def get_ai_answer(client, question_text):
     --- Question ---
     {question_text}
     """
+
+# get_ai_answer が失敗時に返す文言（キャッシュしない）
+AI_FAILURE_PREFIXES = ("API未設定", "エラー:", "生成失敗")
+
+def build_prompt(question_text):
+    return PROMPT_TEMPLATE.format(question_text=question_text)
+
+def is_ai_failure(text):
+    return text.startswith(AI_FAILURE_PREFIXES)
+
+def get_ai_answer(client, question_text, limiter=None):
+    if not client: return "API未設定"
     
-    max_retries = 3
-    base_wait = 20
-    for attempt in range(max_retries):
+    # 429 は指数バックオフ（retryDelay があればそれに従う）で再試行する
+    limiter = limiter or ModelLimiter.for_model(MODEL_ID, AI_RATE_LIMITS)
+    return generate_with_backoff(client, MODEL_ID, build_prompt(question_text), limiter)
+
+def iter_question_sources():
+    # 02 が出力した問題ストア(JSONL)があればレコード(dict)を1行ずつ、なければカード1枚分のHTML(str)を返す
+    if is_store_fresh(QUESTIONS_FILE, INPUT_FILE):
+        records = read_question_store(QUESTIONS_FILE)
         try:
-            response = client.models.generate_content(model=MODEL_ID, contents=prompt)
-            return response.text.strip()
-        except Exception as e:
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                wait = base_wait * (attempt + 1)
-                print(f"   ⏳ 制限待機中... ({wait}秒)")
-                time.sleep(wait)
-            else:
-                return f"エラー: {e}"
-    return "生成失敗"
+            first = next(records, None)
+        except ValueError as e:
+            print(f"⚠️ {e} / HTMLを解析し直します")
+        else:
+            print(f"📂 問題ストアを読み込みます: {QUESTIONS_FILE}")
+            if first is not None:
+                yield first
+            yield from records
+            return
+    yield from iter_card_html(INPUT_FILE)
 
-def main():
-    if not os.path.exists(INPUT_FILE):
-        print("❌ ファイルが見つかりません")
+def to_record(source):
+    # HTMLのカードは解析してレコードにする（カードが見つからなければ None）
+    return source if isinstance(source, dict) else parse_card_html(source, HTML_PARSER)
+
+def iter_questions():
+    for source in iter_question_sources():
+        record = to_record(source)
+        if record is not None:
+            yield record
+
+def iter_targets(announce=True, raw=False):
+    # TEST_LIMIT までの問題を順に返す（raw=True なら解析前のHTMLのまま返す）
+    items = iter_question_sources() if raw else iter_questions()
+    for i, record in enumerate(items):
+        if TEST_LIMIT is not None and i >= TEST_LIMIT:
+            if announce:
+                print(f"\n🛑 制限 ({TEST_LIMIT}問) に達しました。")
+            return
+        yield record
+
+def count_targets():
+    # 進捗表示（残り時間の目安）用に問題数を数える
+    total = sum(1 for _ in iter_question_sources())
+    return min(total, TEST_LIMIT) if TEST_LIMIT is not None else total
+
+def parse_sources(sources, cpu_pool=None):
+    # HTMLのカードをレコードにする（カードが見つからなければ None）
+    # cpu_pool があれば STREAM_CHUNK 枚ずつ別プロセスでまとめて解析する（全カードを一度にメモリに載せない）
+    if cpu_pool is None:
+        yield from map(to_record, sources)
         return
+    parse = partial(parse_card_html, parser=HTML_PARSER)
+    for chunk in iter_chunks(sources, STREAM_CHUNK):
+        # 別プロセスでの解析時間（プロセス間の受け渡しを含む）
+        with metrics.timer('parse.chunk'):
+            records = cpu_pool.map(parse, chunk)
+        yield from records
 
-    client = init_client()
-    print(f"🚀 処理開始 | モード: {AI_TARGET_MODE} | モデル: {MODEL_ID}")
+def spool_records(records, path):
+    # 解析したレコードを、問題ストアと同じ形式で一時ファイルにも書きながら返す（全問をメモリに持たない）
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            if record is not None:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                yield record
+    os.replace(tmp_path, path)
 
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f, 'html.parser')
-    
-    cards = soup.find_all('div', class_='question-card')
-    questions_data = []
-    translator = GoogleTranslator(source='auto', target='ja')
-    
-    process_count = 0
-    total_cards = len(cards)
-    print(f"📊 全問題数: {total_cards}問")
+def plan_dedup(cpu_pool=None):
+    # 翻訳・AI解説の前に全問を1回なめて、同じ問題の別スレッドを探す
+    # HTMLから読む場合は、ここで（cpu_pool があれば別プロセスで並列に）解析したレコードを DEDUP_RECORDS_FILE に書き、
+    # 本処理はそれを読む（カードを2回解析しない）
+    with metrics.timer('dedup.plan'):
+        sources = iter_targets(raw=True)
+        first = next(sources, None)
+        sources = chain([first], sources) if first is not None else sources
+        if isinstance(first, str):
+            records = spool_records(parse_sources(sources, cpu_pool), DEDUP_RECORDS_FILE)
+            plan = find_duplicates(enumerate(records), DEDUP_THRESHOLD)
+            plan.records_file = DEDUP_RECORDS_FILE
+            return plan
+        return find_duplicates(((seq, record) for seq, record in enumerate(sources) if record is not None), DEDUP_THRESHOLD)
 
-    for i, card in enumerate(cards):
-        if TEST_LIMIT is not None and process_count >= TEST_LIMIT:
-            print(f"\n🛑 制限 ({TEST_LIMIT}問) に達しました。")
-            break
+def iter_sources(plan):
+    # 重複をまとめた後の問題を (連番, 元データ, 代表にまとめた投票など) で返す。重複したスレッドは飛ばす
+    if plan is not None and plan.records_file:
+        sources = read_question_store(plan.records_file)
+    else:
+        sources = iter_targets(announce=plan is None, raw=True)
+    for seq, source in enumerate(sources):
+        if plan is not None and seq in plan.duplicate_of:
+            continue
+        yield seq, source, plan.merged.get(seq) if plan is not None else None
 
-        full_text = card.get_text(" ", strip=True)
-        suggested_match = re.search(r'Suggested Answer:\s*([A-Za-z]+)', full_text)
-        suggested_ans = suggested_match.group(1) if suggested_match else "-"
-        
-        # 投票情報の詳細を取得（display:none を除外）
-        vote_bars = card.find_all('div', class_='vote-bar')
-        vote_distribution = []
-        vote_ans = "-"
-        
-        for bar in vote_bars:
-            # display: none の要素はスキップ
-            style_attr = bar.get('style', '')
-            if 'display: none' in style_attr or 'display:none' in style_attr:
-                continue
-                
-            vote_text = bar.get_text(strip=True)
-            if vote_text and '(' in vote_text and ')' in vote_text:
-                # "A (100%)" のような形式から抽出
-                match = re.match(r'([A-Z]+)\s*\((\d+)%\)', vote_text)
-                if match:
-                    choice = match.group(1)
-                    percentage = match.group(2)
-                    # 投票数を取得
-                    votes_attr = bar.get('data-original-title', '')
-                    votes_match = re.search(r'(\d+)\s*vote', votes_attr)
-                    votes_count = votes_match.group(1) if votes_match else "?"
-                    vote_distribution.append(f"{choice}: {percentage}% ({votes_count}票)")
-                    
-                    # 最初の（最も多い）投票を vote_ans とする
-                    if vote_ans == "-":
-                        vote_ans = choice
-        
-        vote_detail_html = "<br>".join(vote_distribution) if vote_distribution else "投票なし"
-        
-        # コミュニティ内で意見が割れているか判定（複数の選択肢に投票がある）
-        is_community_split = len(vote_distribution) > 1
-        
-        # サイト解答とコミュニティ最多投票が異なるか判定
-        is_site_community_split = (vote_ans != "-" and suggested_ans != vote_ans)
-        
-        should_run_ai = False
-        if AI_TARGET_MODE == 'ALL': 
+def source_key(fragments, source, merged):
+    # まとめた投票が変われば（別スレッドが増えた・投票が進んだ）カードも作り直す
+    return fragments.key(source if merged is None else {'source': source, 'merged': merged})
+
+def apply_merged(record, merged):
+    return dict(record, **merged) if record is not None and merged else record
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def question_texts(record):
+    # 翻訳する文: [問題文, 選択肢1, 選択肢2, ...]
+    return [record['stem']] + [choice['text'] for choice in record['choices']]
+
+def format_vote(vote):
+    votes_count = vote['votes'] if vote['votes'] is not None else "?"
+    if vote.get('estimated'):
+        # 重複スレッドをまとめた時に、票数の分からないスレッドの分を割合から見積もった
+        votes_count = f"約{votes_count}"
+    return f"{vote['choice']}: {vote['percent']}% ({votes_count}票)"
+
+TEXTBOOK_HEADER = """<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>CIS-CSM Master</title><style>
+        body{font-family:"Segoe UI",sans-serif;background:#f0f2f5;padding:20px;color:#333} .question-card{background:#fff;max-width:850px;margin:0 auto 30px;padding:25px;border-radius:10px;box-shadow:0 2px 8px rgba(0,0,0,.1)}
+        .q-header{display:flex;justify-content:space-between;border-bottom:2px solid #eee;padding-bottom:15px;margin-bottom:15px} .q-title{font-weight:bold;color:#0056b3}
+        .warning{color:#d9534f;background:#fce8e6;padding:2px 8px;border-radius:4px;font-size:0.9em;margin-left:10px;font-weight:bold}
+        .warning-community{color:#ff8c00;background:#fff3e0;padding:2px 8px;border-radius:4px;font-size:0.9em;margin-left:10px;font-weight:bold}
+        .btn-group{display:flex;gap:10px} .toggle-btn{border:1px solid #ccc;background:#fff;padding:5px 15px;border-radius:20px;cursor:pointer} .answer-btn{background:#e3f2fd;color:#1565c0;font-weight:bold}
+        .jp-choices li{padding:8px;margin-bottom:5px;background:#f8f9fa;border-radius:5px} .jp-letter{font-weight:bold;color:#0056b3;margin-right:10px}
+        .answer-section{margin-top:20px;padding-top:15px;border-top:1px solid #eee;display:flex;gap:15px;flex-wrap:wrap}
+        .ans-box{background:#f8f9fa;padding:10px;border:1px solid #ddd;border-radius:5px;text-align:center;min-width:80px}
+        .community-box{background:#e6f9ed;border-color:#c3e6cb;border-left:4px solid #28a745;min-width:200px}
+        .ai-box{background:#f3e5f5;border-color:#e1bee7;border-left:4px solid #8e44ad;text-align:left;flex:1;min-width:250px}
+        .ans-value{font-weight:bold;font-size:1.2em} .ans-value-sm{font-size:0.95em;line-height:1.4}
+        .ans-label{display:block;font-weight:bold;margin-bottom:5px;color:#666}
+        .ref-link{margin-left:auto;align-self:center;text-decoration:none;color:#007bff}
+        </style><script>
+        function toggleLang(id){var j=document.getElementById('jp-area-'+id),e=document.getElementById('en-area-'+id);if(j.style.display==='none'){j.style.display='block';e.style.display='none'}else{j.style.display='none';e.style.display='block'}}
+        function toggleAns(id,b){var a=document.getElementById('ans-area-'+id);if(a.style.display==='none'){a.style.display='flex';b.innerText='🙈 隠す'}else{a.style.display='none';b.innerText='🫣 正解を表示'}}
+        </script></head><body><h1 style="text-align:center">CIS-CSM 問題集 (AI Split Only)</h1>"""
+
+def analyze_votes(record):
+    suggested_ans = record['suggested_answer']
+
+    # 投票は多い順に並んでいる。最初の（最も多い）投票を vote_ans とする
+    vote_distribution = [format_vote(vote) for vote in record['votes']]
+    vote_ans = record['votes'][0]['choice'] if record['votes'] else "-"
+
+    # コミュニティ内で意見が割れているか判定（複数の選択肢に投票がある）
+    is_community_split = len(vote_distribution) > 1
+
+    # サイト解答とコミュニティ最多投票が異なるか判定
+    is_site_community_split = (vote_ans != "-" and suggested_ans != vote_ans)
+
+    should_run_ai = False
+    if AI_TARGET_MODE == 'ALL': 
+        should_run_ai = True
+    elif AI_TARGET_MODE == 'SPLIT_ONLY':
+        # サイトとコミュニティの意見が割れている、またはコミュニティ内で意見が割れている
+        if is_site_community_split or is_community_split: 
             should_run_ai = True
-        elif AI_TARGET_MODE == 'SPLIT_ONLY':
-            # サイトとコミュニティの意見が割れている、またはコミュニティ内で意見が割れている
-            if is_site_community_split or is_community_split: 
-                should_run_ai = True
-        
-        # アイコン表示：サイトとコミュニティが割れている場合は⚠️、コミュニティ内だけの割れは🤔
-        if is_site_community_split:
-            status_icon = "⚠️"
-        elif is_community_split:
-            status_icon = "🤔"
-        else:
-            status_icon = "✅"
-        
-        print(f"   [{i+1}] {status_icon} Ans:{suggested_ans} / Vote:{vote_ans} ({len(vote_distribution)}選択肢) -> AI生成: {'ON' if should_run_ai else 'OFF'} ...", end="\r")
-        process_count += 1
-
-        q_num = 9999
-        header = card.find('div', class_='q-header')
-        if header:
-            m = re.search(r'Question\s+(\d+)', header.get_text())
-            if m: q_num = int(m.group(1))
-        
-        link_tag = card.find('a', class_='source-link')
-        url = link_tag['href'] if link_tag else "#"
-
-        q_body_div = card.find('div', class_='question-body') or card.find('div', class_='q-text')
-        jp_html_parts = []
-        en_html = ""
-        clean_text_for_ai = ""
-
-        if q_body_div:
-            # ① 先にゴミを削除する
-            for trash in q_body_div.find_all(['script', 'style', 'button', 'div']):
-                # 【追加】安全策: 属性データがない要素はスキップする
-                if not hasattr(trash, 'attrs') or trash.attrs is None:
-                    continue
-
-                # クラス判定を少し緩くしてヒットしやすくする（in判定に変更）
-                trash_classes = trash.get('class', [])
-                if any(c in ['question-answer', 'voting-summary', 'vote-bar'] for c in trash_classes):
-                    trash.decompose()
-            
-            # ② 投票バッジ（Most Votedなど）を削除する
-            for badge in q_body_div.find_all(['span', 'div'], class_=['badge', 'most-voted-answer-badge', 'vote-distribution-bar', 'voted-answers-tally']):
-                badge.decompose()
-            
-            # ③ "Most Voted"テキストを含む要素を削除
-            for element in q_body_div.find_all(string=lambda text: text and "Most Voted" in text):
-                # テキストノードそのものを空文字に置換
-                element.replace_with("")
-            
-            # ④ きれいになった状態でテキストを取得する
-            clean_text_for_ai = q_body_div.get_text("\n", strip=True)
-            en_html = str(q_body_div)
 
-            try:
-                p_text = q_body_div.find('p', class_='card-text')
-                if p_text:
-                    # 既に上で削除済みなので、この部分は不要になりました
-                    txt = p_text.get_text(strip=True)
-                    if txt:
-                        trans = translator.translate(txt)
-                        jp_html_parts.append(f"<p class='jp-text'>{trans}</p>")
-                        time.sleep(0.3)
-
-                choices = q_body_div.find_all('li', class_='multi-choice-item')
-                if choices:
-                    jp_html_parts.append("<ul class='jp-choices'>")
-                    for choice in choices:
-                        letter_span = choice.find('span', class_='multi-choice-letter')
-                        letter = letter_span.get_text(strip=True) if letter_span else "●"
-                        body = choice.get_text(" ", strip=True).replace(letter, "", 1).strip()
-                        t_body = translator.translate(body) if body else ""
-                        css = " ".join(choice.get('class', []))
-                        jp_html_parts.append(f"<li class='{css}'><span class='jp-letter'>{letter}</span> {t_body}</li>")
-                        time.sleep(0.2)
-                    jp_html_parts.append("</ul>")
-            except:
-                jp_html_parts.append("<p>翻訳失敗</p>")
-
-        jp_html = "".join(jp_html_parts) if jp_html_parts else "<p>データなし</p>"
-
-        ai_html = "<span style='color:#999; font-size:0.9em;'>(条件外のためAI解説なし)</span>"
-        if should_run_ai and client and clean_text_for_ai:
-            ai_text = get_ai_answer(client, clean_text_for_ai)
-            ai_html = ai_text.replace("\n", "<br>")
-            time.sleep(5)
-
-        # 警告タグの表示を改善
-        if is_site_community_split:
-            warning_tag = "<span class='warning'>⚠️ サイトと投票で意見割れ</span>"
-        elif is_community_split:
-            warning_tag = "<span class='warning-community'>🤔 コミュニティ内で意見割れ</span>"
-        else:
-            warning_tag = ""
-            
-        card_html = f"""
+    # アイコン表示：サイトとコミュニティが割れている場合は⚠️、コミュニティ内だけの割れは🤔
+    if is_site_community_split:
+        status_icon = "⚠️"
+    elif is_community_split:
+        status_icon = "🤔"
+    else:
+        status_icon = "✅"
+
+    return {
+        'suggested_ans': suggested_ans,
+        'vote_ans': vote_ans,
+        'vote_count': len(vote_distribution),
+        'vote_detail_html': "<br>".join(vote_distribution) if vote_distribution else "投票なし",
+        'is_community_split': is_community_split,
+        'is_site_community_split': is_site_community_split,
+        'should_run_ai': should_run_ai,
+        'status_icon': status_icon,
+    }
+
+def build_jp_html(record, memory):
+    jp_html_parts = []
+    if record['has_body']:
+        try:
+            # 翻訳メモリにある文はそのまま、ない文はまとめて1回のリクエストで翻訳
+            trans_stem, *trans_choices = memory.translate_many(question_texts(record))
+            if record['stem']:
+                jp_html_parts.append(f"<p class='jp-text'>{trans_stem}</p>")
+
+            if record['choices']:
+                jp_html_parts.append("<ul class='jp-choices'>")
+                for choice, t_body in zip(record['choices'], trans_choices):
+                    jp_html_parts.append(f"<li class='{choice['css']}'><span class='jp-letter'>{choice['letter']}</span> {t_body}</li>")
+                jp_html_parts.append("</ul>")
+        except:
+            jp_html_parts.append("<p>翻訳失敗</p>")
+
+    return "".join(jp_html_parts) if jp_html_parts else "<p>データなし</p>"
+
+def render_card(record, info, jp_html, ai_text):
+    q_num = record['num']
+    url = record['url']
+    en_html = record['en_html']
+    suggested_ans = info['suggested_ans']
+    vote_detail_html = info['vote_detail_html']
+    # 同じ問題の別スレッド（投票は足し合わせ済み）
+    duplicate_links = "".join(f'<a href="{d["url"]}" target="_blank" class="ref-link" style="margin-left:10px">別スレッド Q{d["num"]} ↗</a>'
+                              for d in record.get('duplicates', []))
+
+    ai_html = "<span style='color:#999; font-size:0.9em;'>(条件外のためAI解説なし)</span>"
+    if ai_text is not None:
+        ai_html = ai_text.replace("\n", "<br>")
+
+    # 警告タグの表示を改善
+    if info['is_site_community_split']:
+        warning_tag = "<span class='warning'>⚠️ サイトと投票で意見割れ</span>"
+    elif info['is_community_split']:
+        warning_tag = "<span class='warning-community'>🤔 コミュニティ内で意見割れ</span>"
+    else:
+        warning_tag = ""
+        
+    return f"""
         <div class="question-card" id="q{q_num}">
             <div class="q-header">
                 <div class="q-title-group"><span class="q-title">Question {q_num}</span> {warning_tag}</div>
@@ -238,37 +358,348 @@ def main():
                 <div class="ans-box"><span class="ans-label">サイト解答</span><span class="ans-value">{suggested_ans}</span></div>
                 <div class="ans-box community-box"><span class="ans-label">コミュニティ投票</span><span class="ans-value-sm">{vote_detail_html}</span></div>
                 <div class="ans-box ai-box"><span class="ans-label">🤖 AI解説</span><span class="ans-value-sm">{ai_html}</span></div>
-                <a href="{url}" target="_blank" class="ref-link">Discussion ↗</a>
+                <a href="{url}" target="_blank" class="ref-link">Discussion ↗</a>{duplicate_links}
             </div>
         </div>
         """
-        questions_data.append({'num': q_num, 'html': card_html})
 
-    questions_data.sort(key=lambda x: x['num'])
-    print(f"\n📘 ファイル保存中: {OUTPUT_HTML}")
-    
-    with open(OUTPUT_HTML, 'w', encoding='utf-8') as f:
-        f.write("""<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>CIS-CSM Master</title><style>
-        body{font-family:"Segoe UI",sans-serif;background:#f0f2f5;padding:20px;color:#333} .question-card{background:#fff;max-width:850px;margin:0 auto 30px;padding:25px;border-radius:10px;box-shadow:0 2px 8px rgba(0,0,0,.1)}
-        .q-header{display:flex;justify-content:space-between;border-bottom:2px solid #eee;padding-bottom:15px;margin-bottom:15px} .q-title{font-weight:bold;color:#0056b3}
-        .warning{color:#d9534f;background:#fce8e6;padding:2px 8px;border-radius:4px;font-size:0.9em;margin-left:10px;font-weight:bold}
-        .warning-community{color:#ff8c00;background:#fff3e0;padding:2px 8px;border-radius:4px;font-size:0.9em;margin-left:10px;font-weight:bold}
-        .btn-group{display:flex;gap:10px} .toggle-btn{border:1px solid #ccc;background:#fff;padding:5px 15px;border-radius:20px;cursor:pointer} .answer-btn{background:#e3f2fd;color:#1565c0;font-weight:bold}
-        .jp-choices li{padding:8px;margin-bottom:5px;background:#f8f9fa;border-radius:5px} .jp-letter{font-weight:bold;color:#0056b3;margin-right:10px}
-        .answer-section{margin-top:20px;padding-top:15px;border-top:1px solid #eee;display:flex;gap:15px;flex-wrap:wrap}
-        .ans-box{background:#f8f9fa;padding:10px;border:1px solid #ddd;border-radius:5px;text-align:center;min-width:80px}
-        .community-box{background:#e6f9ed;border-color:#c3e6cb;border-left:4px solid #28a745;min-width:200px}
-        .ai-box{background:#f3e5f5;border-color:#e1bee7;border-left:4px solid #8e44ad;text-align:left;flex:1;min-width:250px}
-        .ans-value{font-weight:bold;font-size:1.2em} .ans-value-sm{font-size:0.95em;line-height:1.4}
-        .ans-label{display:block;font-weight:bold;margin-bottom:5px;color:#666}
-        .ref-link{margin-left:auto;align-self:center;text-decoration:none;color:#007bff}
-        </style><script>
-        function toggleLang(id){var j=document.getElementById('jp-area-'+id),e=document.getElementById('en-area-'+id);if(j.style.display==='none'){j.style.display='block';e.style.display='none'}else{j.style.display='none';e.style.display='block'}}
-        function toggleAns(id,b){var a=document.getElementById('ans-area-'+id);if(a.style.display==='none'){a.style.display='flex';b.innerText='🙈 隠す'}else{a.style.display='none';b.innerText='🫣 正解を表示'}}
-        </script></head><body><h1 style="text-align:center">CIS-CSM 問題集 (AI Split Only)</h1>""")
-        for q in questions_data: f.write(q['html'])
-        f.write("</body></html>")
+def build_fingerprint():
+    # カードの描画結果に関わる設定と処理のソース。どれかが変わると、保存済みのカードは全て作り直しになる
+    # （search_index は meta に保存する索引の語の作り方。変わったのに再利用すると、ページ側の検索と語が合わなくなる）
+    parts = [PROMPT_TEMPLATE, MODEL_ID, AI_TARGET_MODE, AI_BATCH_PENDING_TEXT, inspect.getsource(question_parser),
+             inspect.getsource(search_index)]
+    parts += [inspect.getsource(fn) for fn in (format_vote, analyze_votes, build_jp_html, render_card, notebook_row)]
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+def is_reusable(record, info, jp_html, ai_text):
+    # 翻訳の失敗やAI解説の失敗・未反映（バッチ待ち・API未設定）を含むカードは保存せず、次回も作り直す
+    if "<p>翻訳失敗</p>" in jp_html:
+        return False
+    if info['should_run_ai'] and record['ai_text']:
+        return ai_text is not None and ai_text != AI_BATCH_PENDING_TEXT and not is_ai_failure(ai_text)
+    return True
+
+def make_batch_backend(client):
+    # GEMINI_BATCH_BACKEND=local で、APIを使わないローカルの代役でバッチジョブを再現する
+    if os.getenv("GEMINI_BATCH_BACKEND") == 'local':
+        return LocalBatchBackend('.cache/local_batches', lambda model, prompt: f"正解: A\n解説: ({model}) ローカルバッチのダミー解説です。")
+    return GeminiBatchBackend(client) if client else None
+
+def run_ai_batch(targets, ai_cache, client):
+    backend = make_batch_backend(client)
+    runner = BatchRunner(backend, MODEL_ID, ai_cache.template_hash, AI_BATCH_STATE_FILE, AI_BATCH_JOB_FILE, AI_BATCH_RESULTS_FILE)
+
+    # 前回までの結果ファイルを先に取り込む（ここはAPIを使わない）
+    merged = runner.merge_results(ai_cache, is_ai_failure)
+    if merged:
+        print(f"📥 バッチ結果から {merged} 件のAI解説を取り込みました。")
+    if backend is None:
+        return
+
+    state = runner.load_state()
+    if state is None:
+        # キャッシュにない問題のプロンプトだけをジョブにする（同じ問題文は1回だけ）
+        requests = []
+        seen = set()
+        for record in targets:
+            question_text = record['ai_text']
+            if not analyze_votes(record)['should_run_ai'] or not question_text or question_text in seen:
+                continue
+            seen.add(question_text)
+            if ai_cache.peek(question_text) is None:
+                requests.append((record['num'], question_text, build_prompt(question_text)))
+        if not requests:
+            return
+        state = runner.submit(requests)
+        print(f"📦 {len(requests)} 問をバッチジョブとして投入しました: {state['job_name']}")
+    else:
+        print(f"📦 前回投入したバッチジョブの続きを確認します: {state['job_name']}")
+
+    if runner.poll(state, wait=AI_BATCH_WAIT, interval=AI_BATCH_POLL_INTERVAL):
+        merged = runner.merge_results(ai_cache, is_ai_failure)
+        print(f"📥 バッチ結果から {merged} 件のAI解説を取り込みました。")
+
+def resolve_ai(pending, ai_cache):
+    # AI解説のリクエスト結果を受け取り、成功したものはキャッシュに保存する
+    if pending is None or isinstance(pending, str):
+        return pending
+    question_text, future = pending
+    ai_text = future.result()
+    if not is_ai_failure(ai_text):
+        ai_cache.put(question_text, ai_text)
+    return ai_text
+
+def search_entry(record, info, jp_html):
+    with metrics.timer('search.terms'):
+        return card_entry(record, info['status_icon'], jp_html)
+
+AI_ANSWER_RE = re.compile(r'正解\s*[:：]\s*(.+)')
+
+def notebook_row(record, info, ai_text):
+    # Excelノートの生成する列（notebook_writer.GENERATED_COLUMNS の順）。AI解説は「正解:」の行だけ載せる
+    # ノートの行は問題番号で探すので、番号のないカード（エラーのカードなど）は載せない（None）
+    if record['num'] == UNKNOWN_NUM:
+        return None
+    ai_answer = ""
+    if ai_text and ai_text != AI_BATCH_PENDING_TEXT and not is_ai_failure(ai_text):
+        m = AI_ANSWER_RE.search(ai_text)
+        ai_answer = m.group(1).strip()[:100] if m else ""
+    votes = " / ".join(format_vote(vote) for vote in record['votes']) or "投票なし"
+    return [record['num'], info['status_icon'], info['suggested_ans'], info['vote_ans'], votes, ai_answer, record['stem'][:1000], record['url']]
+
+def add_outputs(search, notebook, num, seq, meta):
+    # カード以外の出力（検索用の索引・Excelノート）に1問分を加える
+    search.add(num, seq, meta['search'])
+    if meta['notebook'] is not None:
+        notebook.add(num, meta['notebook'])
+
+def flush_ready(pending, spool, ai_cache, fragments, outputs, limit, progress):
+    # 先頭から順に、AI解説が揃ったカードを描画して書き出す（limit を超えている間は揃うまで待つ）
+    while pending:
+        q = pending[0]
+        ready = not isinstance(q['ai'], tuple) or q['ai'][1].done()
+        if not ready and len(pending) <= limit:
+            break
+        pending.popleft()
+        ai_text = resolve_ai(q['ai'], ai_cache)
+        with metrics.timer('render.card'):
+            card_html = render_card(q['record'], q['info'], q['jp_html'], ai_text)
+        spool.add(q['num'], card_html, q['seq'])
+        meta = {'search': search_entry(q['record'], q['info'], q['jp_html']), 'notebook': notebook_row(q['record'], q['info'], ai_text)}
+        add_outputs(*outputs, q['num'], q['seq'], meta)
+        if is_reusable(q['record'], q['info'], q['jp_html'], ai_text):
+            fragments.put(q['key'], q['num'], card_html, meta)
+        else:
+            fragments.skip(q['num'])
+        progress.update()
+
+def prefetch_translations(records, memory):
+    # このまとまりの未翻訳の文を、先にまとめて翻訳しておく
+    try:
+        new_count = memory.prefetch(text for r in records if r['has_body'] for text in question_texts(r))
+        if new_count:
+            print(f"\n🌐 未翻訳 {new_count} 文をまとめて翻訳しました（累計リクエスト {memory.requests} 回）")
+    except Exception as e:
+        print(f"\n⚠️ まとめ翻訳に失敗しました（問題ごとに再試行します）: {e}")
+
+def print_progress(i, info):
+    print(f"   [{i+1}] {info['status_icon']} Ans:{info['suggested_ans']} / Vote:{info['vote_ans']} ({info['vote_count']}選択肢) -> AI生成: {'ON' if info['should_run_ai'] else 'OFF'} ...", end="\r")
+
+def print_reused(i, num):
+    print(f"   [{i+1}] ♻️ Question {num}: 変更なし（保存済みのカードを使用） ...", end="\r")
+
+def run_serial(spool, memory, ai_cache, scheduler, use_batch, fragments, outputs, plan, progress):
+    pending = deque()
+    i = 0
+
+    for chunk in iter_chunks(iter_sources(plan), STREAM_CHUNK):
+        # 変更のない問題は保存済みのカードをそのまま使い、残りだけ解析・翻訳・AI解説・描画する
+        targets = []
+        for seq, source, merged in chunk:
+            key = source_key(fragments, source, merged)
+            cached = fragments.get(key)
+            if cached is not None:
+                num, card_html, meta = cached
+                print_reused(i, num)
+                i += 1
+                spool.add(num, card_html, seq)
+                add_outputs(*outputs, num, seq, meta)
+                progress.update()
+                continue
+            record = apply_merged(to_record(source), merged)
+            if record is not None:
+                targets.append((seq, key, record))
+        prefetch_translations([record for _, _, record in targets], memory)
+
+        for seq, key, record in targets:
+            info = analyze_votes(record)
+            should_run_ai = info['should_run_ai']
+            print_progress(i, info)
+            i += 1
+
+            jp_html = build_jp_html(record, memory)
+
+            # AI解説はキャッシュになければスケジューラーに投げておき、応答が届いた順に書き出す
+            ai_pending = None
+            clean_text_for_ai = record['ai_text']
+            if should_run_ai and clean_text_for_ai:
+                ai_pending = ai_cache.get(clean_text_for_ai)
+                if ai_pending is None and scheduler:
+                    ai_pending = (clean_text_for_ai, scheduler.submit(build_prompt(clean_text_for_ai)))
+                elif ai_pending is None and use_batch:
+                    ai_pending = AI_BATCH_PENDING_TEXT
+
+            pending.append({'seq': seq, 'key': key, 'num': record['num'], 'record': record, 'info': info, 'jp_html': jp_html, 'ai': ai_pending})
+            flush_ready(pending, spool, ai_cache, fragments, outputs, MAX_PENDING_CARDS, progress)
+
+    if pending and scheduler:
+        print(f"\n🤖 残りのAI解説の応答を待っています...（同時 {AI_MAX_CONCURRENCY} 件まで）")
+    flush_ready(pending, spool, ai_cache, fragments, outputs, 0, progress)
+
+def run_parallel(spool, memory, ai_cache, client, limiter, use_batch, fragments, outputs, plan, progress, cpu_pool):
+    # 解析(CPU, 別プロセス) -> 翻訳(I/O) -> AI解説(I/O) -> 書き出し(このスレッド) の順に、段ごとのワーカーで同時に処理する
+    # 各問題には入力順の連番(seq)を持たせ、書き出し時に同じ番号どうしの並び順に使う（逐次処理と同じ出力になる）
+    call_ai = client is not None and not use_batch
+
+    def parse(item):
+        source = item.pop('source')
+        merged = item.pop('merged')
+        # 変更のない問題は保存済みのカードを使い、後ろの段では何もしない
+        item['key'] = source_key(fragments, source, merged)
+        cached = fragments.get(item['key'])
+        if cached is not None:
+            item['num'], item['cached'], item['meta'] = cached
+            return item
+        if isinstance(source, dict):
+            item['record'] = source
+        else:
+            # 別プロセスでの解析時間（プロセス間の受け渡しを含む）
+            with metrics.timer('parse.card'):
+                item['record'] = cpu_pool.run(parse_card_html, source, HTML_PARSER)
+        item['record'] = apply_merged(item['record'], merged)
+        if item['record'] is not None:
+            item['info'] = analyze_votes(item['record'])
+        return item
+
+    def translate(items):
+        items = [item for item in items if 'cached' in item or item['record'] is not None]
+        targets = [item for item in items if 'cached' not in item]
+        prefetch_translations([item['record'] for item in targets], memory)
+        for item in targets:
+            item['jp_html'] = build_jp_html(item['record'], memory)
+            item['search'] = search_entry(item['record'], item['info'], item['jp_html'])
+        return items
+
+    def answer(item):
+        if 'cached' in item:
+            return item
+        ai_text = None
+        clean_text_for_ai = item['record']['ai_text']
+        if item['info']['should_run_ai'] and clean_text_for_ai:
+            ai_text = ai_cache.get(clean_text_for_ai)
+            if ai_text is None and call_ai:
+                ai_text = get_ai_answer(client, clean_text_for_ai, limiter)
+                if not is_ai_failure(ai_text):
+                    ai_cache.put(clean_text_for_ai, ai_text)
+            elif ai_text is None and use_batch:
+                ai_text = AI_BATCH_PENDING_TEXT
+        item['ai_text'] = ai_text
+        return item
+
+    stages = [
+        Stage('parse', parse, workers=PARSE_WORKERS or os.cpu_count() or 1),
+        Stage('translate', translate, workers=TRANSLATE_WORKERS, batch_size=STREAM_CHUNK),
+        Stage('ai', answer, workers=AI_MAX_CONCURRENCY if call_ai else 1),
+    ]
+    sources = ({'seq': seq, 'source': source, 'merged': merged} for seq, source, merged in iter_sources(plan))
+    for i, item in enumerate(run_pipeline(sources, stages, PIPELINE_QUEUE_SIZE)):
+        if 'cached' in item:
+            print_reused(i, item['num'])
+            spool.add(item['num'], item['cached'], item['seq'])
+            add_outputs(*outputs, item['num'], item['seq'], item['meta'])
+            progress.update()
+            continue
+        print_progress(i, item['info'])
+        record = item['record']
+        with metrics.timer('render.card'):
+            card_html = render_card(record, item['info'], item['jp_html'], item['ai_text'])
+        spool.add(record['num'], card_html, item['seq'])
+        meta = {'search': item['search'], 'notebook': notebook_row(record, item['info'], item['ai_text'])}
+        add_outputs(*outputs, record['num'], item['seq'], meta)
+        if is_reusable(record, item['info'], item['jp_html'], item['ai_text']):
+            fragments.put(item['key'], record['num'], card_html, meta)
+        else:
+            fragments.skip(record['num'])
+        progress.update()
+
+def main():
+    global MODEL_ID
+    metrics.REGISTRY.reset()
+    if not os.path.exists(INPUT_FILE) and not os.path.exists(QUESTIONS_FILE):
+        print("❌ ファイルが見つかりません")
+        return
+
+    client = init_client()
+    if MODEL_ID == 'auto':
+        with metrics.timer('model_probe.select'):
+            MODEL_ID = select_model(client, probe_file=MODEL_PROBE_FILE)
+    print(f"🚀 処理開始 | モード: {AI_TARGET_MODE} | モデル: {MODEL_ID}")
+
+    translator = GoogleTranslator(source='auto', target='ja')
+    memory = TranslationMemory(TRANSLATION_MEMORY_FILE, translator, target='ja')
+    ai_cache = AICache(AI_CACHE_FILE, PROMPT_TEMPLATE, MODEL_ID, prune_stale=AI_CACHE_PRUNE)
+    limiter = ModelLimiter.for_model(MODEL_ID, AI_RATE_LIMITS)
+    use_batch = AI_RUN_MODE == 'batch'
+
+    # HTMLの解析に使う別プロセス（重複探しと本処理で共有する。'serial' では使わない）
+    cpu_pool = CpuPool(PARSE_WORKERS) if PIPELINE_MODE == 'parallel' else None
+    plan = plan_dedup(cpu_pool) if DEDUP else None
+    if plan:
+        print(f"🧩 {plan.summary()}")
+
+    if use_batch:
+        targets = (apply_merged(to_record(source), merged) for _, source, merged in iter_sources(plan))
+        run_ai_batch((record for record in targets if record is not None), ai_cache, client)
+
+    # カードは出来た順に .part ファイルへ書き出し、最後に問題番号順に並べて完成版にする
+    print(f"📘 書き出し先: {OUTPUT_HTML}")
+    footer = (search_panel(OUTPUT_HTML) if SEARCH_INDEX else "") + "</body></html>"
+    if OUTPUT_MODE == 'paged':
+        spool = PagedSpool(OUTPUT_HTML, TEXTBOOK_HEADER, footer, PAGE_SIZE)
+    else:
+        spool = CardSpool(OUTPUT_HTML, TEXTBOOK_HEADER, footer)
+    outputs = (SearchIndex(), NotebookWriter(NOTEBOOK_FILE, NOTEBOOK_STATE_FILE))
+    search, notebook = outputs
+    progress = metrics.Progress(count_targets() - len(plan or ()) if LIVE_PROGRESS else None, "生成", LIVE_PROGRESS)
+    # 前回から変わっていないカードは保存済みのものを差し込む（全問を処理し終えたら、使われなくなったカードは消す）
+    fragments = FragmentCache(FRAGMENT_CACHE_DIR, build_fingerprint(), enabled=INCREMENTAL_BUILD)
+    completed = False
+
+    try:
+        if PIPELINE_MODE == 'parallel':
+            run_parallel(spool, memory, ai_cache, client, limiter, use_batch, fragments, outputs, plan, progress, cpu_pool)
+        else:
+            scheduler = AIScheduler(client, MODEL_ID, limiter, max_concurrency=AI_MAX_CONCURRENCY) if client and not use_batch else None
+            try:
+                run_serial(spool, memory, ai_cache, scheduler, use_batch, fragments, outputs, plan, progress)
+            finally:
+                if scheduler:
+                    scheduler.shutdown()
+        completed = True
+    finally:
+        if cpu_pool:
+            cpu_pool.shutdown()
+        progress.close()
+        fragments.save(prune=completed and TEST_LIMIT is None)
+
+    print(f"\n📊 処理した問題数: {len(spool)}問")
+    print(f"📘 ファイル保存中: {OUTPUT_HTML}")
+    spool.finish()
+    if OUTPUT_MODE == 'paged':
+        print(f"📄 {len(spool.pages)} ページに分けて保存しました: {spool.pages_dir}/")
+    if SEARCH_INDEX:
+        with metrics.timer('search.write'):
+            search.write(index_path(OUTPUT_HTML))
+        print(f"🔍 検索用の索引を保存しました: {index_path(OUTPUT_HTML)}")
+    if NOTEBOOK_FILE:
+        if notebook.finish():
+            print(f"📒 {notebook.summary()}")
+
+    print(fragments.summary())
+    print(memory.summary())
+    print(ai_cache.summary())
+    if AI_CACHE_PRUNE:
+        ai_cache.save()
 
+    report = metrics.REGISTRY.write_report(RUN_REPORT_FILE, '03_generate_study_kit', {
+        'cards': len(spool), 'pipeline': PIPELINE_MODE, 'ai_mode': AI_RUN_MODE, 'model': MODEL_ID,
+        'translation': {'lookups': memory.lookups, 'misses': memory.misses, 'requests': memory.requests},
+        'ai_cache': {'hits': ai_cache.hits, 'misses': ai_cache.misses},
+        'fragments': {'reused': fragments.hits, 'rebuilt': fragments.misses},
+        'dedup': {'duplicates': len(plan or ()), 'groups': len(plan.merged) if plan else 0},
+    })
+    print("\n".join(metrics.summary_lines(report)))
+    print(f"📝 実行レポート: {RUN_REPORT_FILE}")
     print("🎉 完了しました！")
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# AI解説のキャッシュ
+#
+# キーは「正規化した問題文 + プロンプトのテンプレート + モデルID」のハッシュです。
+# 問題文・プロンプト・モデルのどれかが変わればキーが変わるので、古い解説は使われません（自動で無効化）。
+# prune_stale=True にすると、今のプロンプト・モデルでは二度と使われない古い解説を保存時に削除します。
+
+
+def normalize_question(text):
+    # 空白や改行の違いだけでキャッシュが外れないようにする
+    return " ".join(text.split())
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class AICache:
+    def __init__(self, path, template, model, prune_stale=False):
+        self.path = path
+        self.model = model
+        self.template_hash = text_hash(template)[:16]
+        self.prune_stale = prune_stale
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ AI解説キャッシュが読めないため作り直します: {e}")
+            return {}
+
+    def key(self, question_text):
+        material = json.dumps([normalize_question(question_text), self.template_hash, self.model], ensure_ascii=False)
+        return text_hash(material)
+
+    def is_stale(self, entry):
+        return entry.get('model') != self.model or entry.get('template') != self.template_hash
+
+    def stale_count(self):
+        with self.lock:
+            return sum(1 for entry in self.entries.values() if self.is_stale(entry))
+
+    def get(self, question_text):
+        with self.lock:
+            entry = self.entries.get(self.key(question_text))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry['text']
+
+    def peek(self, question_text):
+        # 統計に数えずに確認だけする
+        with self.lock:
+            entry = self.entries.get(self.key(question_text))
+            return entry['text'] if entry else None
+
+    def put(self, question_text, answer):
+        with self.lock:
+            self.entries[self.key(question_text)] = {
+                'model': self.model,
+                'template': self.template_hash,
+                'created_at': time.time(),
+                'text': answer,
+            }
+        # 1件ごとに保存する（途中で止まっても、使ったAPI枠の分の解説は残す）
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self.lock:
+            if self.prune_stale:
+                self.entries = {k: v for k, v in self.entries.items() if not self.is_stale(v)}
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = f"{self.hits / total * 100:.0f}%" if total else "-"
+        return f"AI解説キャッシュ: ヒット {self.hits} 件 / ミス {self.misses} 件 (ヒット率 {rate}) / 古い解説 {self.stale_count()} 件"
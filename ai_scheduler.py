@@ -0,0 +1,170 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# AI解説リクエストのスケジューラー
+#
+# - モデルごとの RPM（1分あたりのリクエスト数）/ TPM（1分あたりのトークン数）をトークンバケットで守る
+# - 429 (RESOURCE_EXHAUSTED) は指数バックオフ＋ジッターで再試行し、サーバーの retryDelay があればそれに従う
+# - 同時に投げるリクエスト数は max_concurrency までに抑える
+
+# モデルごとの上限（無料枠の目安。契約に合わせて 03 側から上書きしてください）
+# model_probe.CANDIDATES（MODEL_ID = 'auto' で選ばれうるモデル）は全部ここに書いておく（書かないと DEFAULT_LIMITS になる）
+MODEL_LIMITS = {
+    'models/gemini-2.5-pro': {'rpm': 5, 'tpm': 250000},
+    'models/gemini-3-pro-preview': {'rpm': 5, 'tpm': 250000},     # pro と同じ扱い
+    'models/gemini-2.5-flash': {'rpm': 10, 'tpm': 250000},
+    'models/gemini-flash-latest': {'rpm': 10, 'tpm': 250000},     # 最新の flash の別名（2.5-flash と同じ扱い）
+    'models/gemini-2.0-flash': {'rpm': 15, 'tpm': 1000000},
+    'models/gemini-2.0-flash-exp': {'rpm': 10, 'tpm': 250000},    # 試験版は 2.0-flash より枠が小さい
+}
+DEFAULT_LIMITS = {'rpm': 5, 'tpm': 250000}
+
+OUTPUT_TOKEN_ESTIMATE = 1000  # 1回の解説で返ってくるトークン数の見込み
+
+
+def estimate_tokens(prompt):
+    # 日本語混じりなので少し多めに見積もる（実際の消費量は応答の usageMetadata で補正する）
+    return len(prompt) // 3 + OUTPUT_TOKEN_ESTIMATE
+
+
+def is_rate_limited(error):
+    text = str(error)
+    return getattr(error, 'code', None) == 429 or "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+def parse_retry_after(error):
+    # サーバーからの再試行の目安（秒）。エラー本文の retryDelay か、Retry-After ヘッダーから読む
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(error))
+    if match:
+        return float(match.group(1))
+    match = re.search(r"retry in (\d+(?:\.\d+)?)\s*s", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+        if value and value.strip().replace('.', '', 1).isdigit():
+            return float(value)
+    return None
+
+
+class TokenBucket:
+    # capacity まで貯まり、1分あたり per_minute ずつ回復するバケツ
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        # 今すぐ amount を使い、使えるようになるまでの待ち時間（秒）を返す（残高はマイナスになり得る）
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    @classmethod
+    def for_model(cls, model, overrides=None):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(MODEL_LIMITS.get(model, {}))
+        limits.update((overrides or {}).get(model, {}))
+        return cls(limits['rpm'], limits['tpm'])
+
+    def acquire(self, token_estimate):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(token_estimate))
+        if wait > 0:
+            metrics.observe('ai.limiter_wait', wait)
+            time.sleep(wait)
+
+    def settle(self, token_estimate, actual_tokens):
+        # 見積もりと実際の消費トークン数の差を戻す（多く使った場合は追加で引く）
+        if actual_tokens is None:
+            return
+        diff = token_estimate - actual_tokens
+        if diff > 0:
+            self.tokens.refund(diff)
+        elif diff < 0:
+            self.tokens.reserve(-diff)
+
+
+def generate_with_backoff(client, model, prompt, limiter, max_retries=5, base_delay=2.0, max_delay=120.0):
+    # 戻り値は get_ai_answer と同じ（成功時は解説テキスト、失敗時は "エラー: ..." / "生成失敗"）
+    token_estimate = estimate_tokens(prompt)
+    for attempt in range(max_retries):
+        limiter.acquire(token_estimate)
+        try:
+            with metrics.timer('ai.request'):
+                response = client.models.generate_content(model=model, contents=prompt)
+        except Exception as e:
+            if not is_rate_limited(e):
+                metrics.count('ai.failed')
+                return f"エラー: {e}"
+            # 指数バックオフ（上限あり）＋ジッター。サーバーの指示があればそれより短くはしない
+            backoff = min(max_delay, base_delay * (2 ** attempt))
+            wait = random.uniform(backoff / 2, backoff)
+            retry_after = parse_retry_after(e)
+            if retry_after is not None:
+                wait = max(wait, retry_after + random.uniform(0, 1))
+            print(f"   ⏳ 制限待機中... ({wait:.1f}秒)")
+            metrics.count('ai.rate_limited')
+            metrics.observe('ai.backoff', wait)
+            time.sleep(wait)
+            continue
+
+        usage = getattr(response, 'usage_metadata', None)
+        total_tokens = getattr(usage, 'total_token_count', None)
+        limiter.settle(token_estimate, total_tokens)
+        if total_tokens:
+            metrics.count('ai.tokens', total_tokens)
+        text = (response.text or "").strip()
+        if not text:
+            # 空の応答（安全フィルター・MAX_TOKENS など）は解説として保存せず、失敗として次回また生成する
+            metrics.count('ai.failed')
+            return f"生成失敗: 空の応答 ({finish_reason(response)})"
+        return text
+    metrics.count('ai.failed')
+    return "生成失敗"
+
+
+def finish_reason(response):
+    candidates = getattr(response, 'candidates', None) or []
+    reason = getattr(candidates[0], 'finish_reason', None) if candidates else None
+    return getattr(reason, 'name', None) or str(reason or "候補なし")
+
+
+class AIScheduler:
+    # submit() で Future を返し、最大 max_concurrency 本を並列に処理する
+    def __init__(self, client, model, limiter, max_concurrency=4, max_retries=5):
+        self.client = client
+        self.model = model
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def submit(self, prompt):
+        return self.executor.submit(generate_with_backoff, self.client, self.model, prompt, self.limiter, self.max_retries)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
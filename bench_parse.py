@@ -0,0 +1,77 @@
+import statistics
+import sys
+import time
+
+from question_parser import BeautifulSoup, clean_question_body, iter_card_html, parse_question_card, resolve_parser
+import question_parser
+
+# 問題カード1枚あたりの「解析＋不要要素の削除」にかかる時間を測るマイクロベンチマーク
+#
+#   python3 bench_parse.py [02の出力HTML] [繰り返し回数]
+#
+# 「変更前」は html.parser ＋ 3回の find_all で掃除する従来の方法、「変更後」は各パーサー ＋ 1回の走査で掃除する方法。
+# 変更後の結果（レコード）が変更前と同じかどうかも確認します。
+
+INPUT_FILE = 'CIS-CSM_Complete_Questions.html'
+REPEAT = 3
+
+
+def legacy_clean_question_body(q_body_div):
+    # 変更前の掃除（本文を3回なめる）
+    for trash in q_body_div.find_all(['script', 'style', 'button', 'div']):
+        if not hasattr(trash, 'attrs') or trash.attrs is None:
+            continue
+        trash_classes = trash.get('class', [])
+        if any(c in ['question-answer', 'voting-summary', 'vote-bar'] for c in trash_classes):
+            trash.decompose()
+    for badge in q_body_div.find_all(['span', 'div'], class_=['badge', 'most-voted-answer-badge', 'vote-distribution-bar', 'voted-answers-tally']):
+        badge.decompose()
+    for element in q_body_div.find_all(string=lambda text: text and "Most Voted" in text):
+        element.replace_with("")
+
+
+def parse_cards(cards, parser, clean):
+    question_parser.clean_question_body = clean
+    try:
+        records, times = [], []
+        for card_html in cards:
+            start = time.perf_counter()
+            card = BeautifulSoup(card_html, parser).find('div', class_='question-card')
+            records.append(parse_question_card(card) if card is not None else None)
+            times.append(time.perf_counter() - start)
+        return records, times
+    finally:
+        question_parser.clean_question_body = clean_question_body
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else REPEAT
+    cards = list(iter_card_html(path))
+    if not cards:
+        print(f"❌ カードが見つかりません: {path}")
+        return
+    print(f"📄 {path}: {len(cards)} カード × {repeat} 回")
+
+    cases = [('変更前 (html.parser + 3回走査)', 'html.parser', legacy_clean_question_body)]
+    cases.append(('変更後 (html.parser + 1回走査)', 'html.parser', clean_question_body))
+    if resolve_parser('auto') == 'lxml':
+        cases.append(('変更後 (lxml + 1回走査)', 'lxml', clean_question_body))
+
+    baseline = None
+    for label, parser, clean in cases:
+        all_times = []
+        for _ in range(repeat):
+            records, times = parse_cards(cards, parser, clean)
+            all_times.extend(times)
+        if baseline is None:
+            baseline = (records, statistics.mean(all_times))
+        same = "同じ" if records == baseline[0] else "❌ 違いあり"
+        mean_us = statistics.mean(all_times) * 1e6
+        median_us = statistics.median(all_times) * 1e6
+        speedup = baseline[1] / statistics.mean(all_times)
+        print(f"   {label:<32} 平均 {mean_us:8.0f}µs / 中央値 {median_us:8.0f}µs / 1カード  x{speedup:.2f}  結果: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fake_gemini import FakeGemini
+from fetcher import SITE_ORIGIN, Fetcher
+from fixture_server import FixtureServer
+from question_parser import iter_card_html, parse_card_html
+from translation_memory import TranslationMemory
+
+# パイプライン全体のベンチマーク（完全オフライン）
+#
+#   python3 benchmark.py                 # 全段を測って結果を保存し、前回との差を表示
+#   python3 benchmark.py 02 03_parse     # 指定した段だけ
+#   python3 benchmark.py --no-save       # 結果を保存しない
+#
+# 録画済みのページ（fixtures/）を fixture_server で返し、翻訳は FakeTranslator、AI解説は fake_gemini で代用します。
+# 段ごとに スループット（pages/s, cards/s）・1件あたりの処理時間（p50/p90/p99）・ピークメモリ（tracemalloc）を測り、
+# 結果を RESULTS_FILE に1回1行で追記します（コミットIDつき）。同じマシン・同じ設定の前回の結果と比べて、
+# REGRESSION_THRESHOLD 以上遅くなった（メモリが増えた）段には ⚠️ を付けます。
+
+# --- 設定 ---
+FIXTURES_DIR = 'fixtures'
+RESULTS_FILE = '.cache/bench_results.jsonl'  # .cache/ は git の管理外
+CATEGORY_NAME = 'servicenow'
+EXAM = 'cis-csm'
+LISTING_PAGES = 4          # fixtures にある一覧ページの数
+STAGE3_SCALE = 5           # 03 は 02 の出力カードをこの倍数に増やして測る（問題文は少しずつ変える）
+TRANSLATE_LATENCY = 0.0    # 代役の翻訳1リクエストの処理時間（秒）
+AI_LATENCY = 0.02          # 代役の Gemini 1リクエストの処理時間（秒）
+REPEAT = 3                 # 各段を何回測るか（スループットは一番よかった回、処理時間は全回分から出す）
+REGRESSION_THRESHOLD = 0.10
+STAGES = ('01', '02', '03_parse', '03_render', '03_full')
+# ------------
+
+
+class FakeTranslator:
+    # 1行ずつ「【訳】」を付けて返す（改行でつないだまとめ翻訳でも行数が変わらない）
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        if TRANSLATE_LATENCY:
+            time.sleep(TRANSLATE_LATENCY)
+        return "\n".join("【訳】" + line for line in text.split("\n"))
+
+
+def load_script(filename):
+    # 01_/02_/03_ は数字で始まるので import 文では読み込めない
+    name = 'bench_' + os.path.splitext(filename)[0]
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(unit, count, seconds, latencies, peak_mb):
+    latencies = sorted(latencies)
+    result = {
+        'unit': unit,
+        'items': count,
+        'seconds': round(seconds, 4),
+        'throughput': round(count / seconds, 2) if seconds else None,
+        'peak_mb': round(peak_mb, 2),
+    }
+    for name, q in (('p50_ms', 0.50), ('p90_ms', 0.90), ('p99_ms', 0.99)):
+        value = percentile(latencies, q)
+        result[name] = round(value * 1000, 3) if value is not None else None
+    return result
+
+
+def timed_items(fn, items):
+    # 1件ずつ fn を呼び、(結果のリスト, 1件ごとの秒数, 合計秒数) を返す
+    results, latencies = [], []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies, time.perf_counter() - start
+
+
+def peak_memory(fn):
+    # 計測の邪魔をしないよう、時間を測る回とは別にもう1回動かしてピークを測る
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+class Bench:
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.m1 = load_script('01_fetch_urls.py')
+        self.m2 = load_script('02_scrape_raw.py')
+        self.m3 = load_script('03_generate_study_kit.py')
+        self.server = FixtureServer(FIXTURES_DIR)
+        self.gemini = FakeGemini(latency=AI_LATENCY)
+        self.listing_urls = [f"{SITE_ORIGIN}/discussions/{CATEGORY_NAME}/{page}/" for page in range(1, LISTING_PAGES + 1)]
+        self.discussion_urls = []
+        self.cards = []
+        self.run_count = 0
+
+    def __enter__(self):
+        self.server.start()
+        self.gemini.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.stop()
+        self.gemini.stop()
+
+    def fresh_dir(self):
+        self.run_count += 1
+        path = os.path.join(self.workdir, f"run{self.run_count}")
+        os.makedirs(path)
+        return path
+
+    # --- 01: 一覧ページの取得とリンク抽出 ---
+    def run_01(self):
+        patterns = self.m1.build_exam_patterns([EXAM])
+        fetcher = Fetcher('http', None, base_url=self.server.base_url)
+        try:
+            def one(url):
+                page_source, _ = fetcher.fetch(url)
+                return self.m1.extract_exam_links(page_source, patterns)[EXAM]
+            results, latencies, seconds = timed_items(one, self.listing_urls)
+        finally:
+            fetcher.close()
+        self.discussion_urls = sorted({url for links in results for url in links})
+        return len(self.listing_urls), latencies, seconds
+
+    # --- 02: 問題ページの取得・抽出・カード化・レコード化 ---
+    def run_02(self):
+        if not self.discussion_urls:
+            self.run_01()
+        fetcher = Fetcher('http', None, base_url=self.server.base_url)
+        try:
+            def one(args):
+                index, url = args
+                page_source, _ = fetcher.fetch(url)
+                q_html = self.m2.extract_question_html(page_source)
+                parse_card_html(self.m2.build_card_html(index, url, q_html), self.m2.HTML_PARSER)
+                return url, q_html
+            results, latencies, seconds = timed_items(one, enumerate(self.discussion_urls, 1))
+        finally:
+            fetcher.close()
+        self.cards = results
+        return len(results), latencies, seconds
+
+    def stage3_cards(self):
+        # 02 の出力を STAGE3_SCALE 倍にしたカード（問題文を少しずつ変えて、キャッシュに当たらないようにする）
+        if not self.cards:
+            self.run_02()
+        cards = []
+        for copy in range(STAGE3_SCALE):
+            for url, q_html in self.cards:
+                if q_html is not None and copy:
+                    q_html = q_html.replace('<p class="card-text">', f'<p class="card-text">[v{copy}] ', 1)
+                cards.append(self.m2.build_card_html(len(cards) + 1, url, q_html))
+        return cards
+
+    # --- 03: カードの解析 ---
+    def run_03_parse(self):
+        cards = self.stage3_cards()
+        _, latencies, seconds = timed_items(lambda card: parse_card_html(card, self.m3.HTML_PARSER), cards)
+        return len(cards), latencies, seconds
+
+    # --- 03: 判定・翻訳（代役）・カードの描画 ---
+    def run_03_render(self):
+        records = [parse_card_html(card, self.m3.HTML_PARSER) for card in self.stage3_cards()]
+        memory = TranslationMemory(os.path.join(self.fresh_dir(), 'translations.json'), FakeTranslator(), request_interval=0)
+
+        def one(record):
+            info = self.m3.analyze_votes(record)
+            return self.m3.render_card(record, info, self.m3.build_jp_html(record, memory), None)
+        _, latencies, seconds = timed_items(one, records)
+        return len(records), latencies, seconds
+
+    # --- 03: スクリプト全体（代役の翻訳・Gemini を使って main() を実行）---
+    def run_03_full(self):
+        workdir = self.fresh_dir()
+        input_file = os.path.join(workdir, 'questions.html')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write(self.m2.create_html_header())
+            f.writelines(self.stage3_cards())
+            f.write("</body></html>")
+
+        m3 = self.m3
+        m3.INPUT_FILE = input_file
+        m3.QUESTIONS_FILE = os.path.join(workdir, 'questions.jsonl')
+        m3.OUTPUT_HTML = os.path.join(workdir, 'textbook.html')
+        m3.TRANSLATION_MEMORY_FILE = os.path.join(workdir, 'translations.json')
+        m3.AI_CACHE_FILE = os.path.join(workdir, 'ai_answers.json')
+        m3.RUN_REPORT_FILE = os.path.join(workdir, 'run_report.json')
+        # 描画済みカードの保存先も毎回空の作業フォルダーにする（前回のカードを再利用すると描画の時間を測れない）
+        m3.FRAGMENT_CACHE_DIR = os.path.join(workdir, 'fragments')
+        m3.NOTEBOOK_FILE = os.path.join(workdir, 'notebook.xlsx')
+        m3.NOTEBOOK_STATE_FILE = os.path.join(workdir, 'notebook_state.json')
+        # 問題文を少し変えただけの複製カードは重複スレッドとしてまとめられてしまうので、まとめずに全枚数を描画する
+        m3.DEDUP = False
+        m3.TEST_LIMIT = None
+        m3.AI_RUN_MODE = 'sync'
+        m3.AI_RATE_LIMITS = {m3.MODEL_ID: {'rpm': 100000, 'tpm': 10 ** 9}}
+        m3.API_KEY = 'bench'
+        m3.GoogleTranslator = FakeTranslator
+        m3.TranslationMemory = lambda path, translator, target='ja': TranslationMemory(path, translator, target, request_interval=0)
+        os.environ['GEMINI_BASE_URL'] = self.gemini.base_url
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            m3.main()
+        seconds = time.perf_counter() - start
+        count = sum(1 for _ in iter_card_html(m3.OUTPUT_HTML))
+        return count, [], seconds
+
+    def measure(self, stage):
+        run = getattr(self, 'run_' + stage)
+        all_latencies, best_seconds = [], None
+        for _ in range(REPEAT):
+            count, latencies, seconds = run()
+            all_latencies.extend(latencies)
+            best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+        unit = 'pages/s' if stage in ('01', '02') else 'cards/s'
+        return summarize(unit, count, best_seconds, all_latencies, peak_memory(run))
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_config():
+    return {
+        'listing_pages': LISTING_PAGES,
+        'stage3_scale': STAGE3_SCALE,
+        'translate_latency': TRANSLATE_LATENCY,
+        'ai_latency': AI_LATENCY,
+    }
+
+
+def load_history(machine, config):
+    # 同じマシン・同じ設定で測った過去の結果（古い順）
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    history = []
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('machine') == machine and record.get('config') == config:
+                history.append(record)
+    return history
+
+
+def previous_result(history, stage):
+    for record in reversed(history):
+        if stage in record['stages']:
+            return record
+    return None
+
+
+def compare(result, previous, stage):
+    # 前回と比べて悪くなった指標を返す
+    if previous is None:
+        return []
+    before = previous['stages'][stage]
+    warnings = []
+    if before.get('throughput') and result['throughput'] is not None:
+        change = result['throughput'] / before['throughput'] - 1
+        if change < -REGRESSION_THRESHOLD:
+            warnings.append(f"スループット {change:+.0%}")
+    for key, label in (('p90_ms', 'p90'), ('peak_mb', 'ピークメモリ')):
+        if before.get(key) and result.get(key) is not None:
+            change = result[key] / before[key] - 1
+            if change > REGRESSION_THRESHOLD:
+                warnings.append(f"{label} {change:+.0%}")
+    return warnings
+
+
+def format_ms(value):
+    return f"{value:8.2f}" if value is not None else "       -"
+
+
+def main():
+    args = sys.argv[1:]
+    save = '--no-save' not in args
+    stages = [a for a in args if not a.startswith('--')] or list(STAGES)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"❌ 不明な段: {', '.join(unknown)}（指定できるのは {', '.join(STAGES)}）")
+        return
+
+    machine = f"{platform.node()} / Python {platform.python_version()}"
+    config = bench_config()
+    history = load_history(machine, config)
+    commit = git_commit()
+    print(f"⏱️ ベンチマーク開始 | commit: {commit} | {machine} | {REPEAT}回ずつ")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, Bench(workdir) as bench:
+        for stage in stages:
+            result = bench.measure(stage)
+            results[stage] = result
+            previous = previous_result(history, stage)
+            warnings = compare(result, previous, stage)
+            mark = f"  ⚠️ {' / '.join(warnings)} (前回 {previous['commit']})" if warnings else ""
+            print(f"   {stage:<10} {result['items']:5d}件 {result['throughput']:9.1f} {result['unit']:<8}"
+                  f" p50 {format_ms(result['p50_ms'])}ms p90 {format_ms(result['p90_ms'])}ms p99 {format_ms(result['p99_ms'])}ms"
+                  f" ピーク {result['peak_mb']:7.2f}MB{mark}")
+
+    if save:
+        record = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'machine': machine,
+            'config': config,
+            'stages': results,
+        }
+        os.makedirs(os.path.dirname(RESULTS_FILE) or '.', exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"💾 結果を '{RESULTS_FILE}' に追記しました。")
+
+
+if __name__ == "__main__":
+    main()
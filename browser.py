@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+import metrics
+from fetcher import USER_AGENT
+
+# Chrome の起動と使い回し（01・02 共通）
+#
+# - ChromeDriverManager が解決したドライバーのパスを保存し、DRIVER_PATH_MAX_AGE_DAYS 日の間はネットワークに問い合わせずに使う
+#   （期限切れで問い合わせに失敗した時も、保存済みのパスが残っていればそれを使う）
+# - ブラウザのプロフィール（Cookie・キャッシュ）を <state_dir>/profile に残す。チャレンジを解除した時の Cookie も
+#   <state_dir>/cookies.json に保存し、次回の Chrome と HTTP での取得に引き継ぐ
+# - keep_alive=True なら終了時に Chrome を閉じずに残し、次のスクリプト（01 の後の 02 など）はそこに接続する
+#   （起動し直さないので速く、チャレンジの解除状態もそのまま使える）
+# 同じプロフィールは複数の Chrome で開けないので、並列に取得するワーカーには worker_session() で
+# ワーカーごとの Chrome（プロフィールは <state_dir>/workers/<番号>、起動時に保存済みの Cookie を入れる）を持たせます。
+# 引き継ぎ用の1台（keep_alive・起動済みの Chrome への接続）は最初のワーカーと 01 が使い、操作は lock で1つずつ行います。
+
+CHROME_BINARY = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"  # MacのChromeの場所（なければ自動で探す）
+DRIVER_PATH_MAX_AGE_DAYS = 7
+DEBUG_PORT = 9222
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def to_cdp_cookie(cookie):
+    # Selenium の get_cookies() の形式 -> CDP の Network.setCookies の形式
+    cdp = {key: cookie[key] for key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite') if key in cookie}
+    if 'expiry' in cookie:
+        cdp['expires'] = cookie['expiry']
+    return cdp
+
+
+def resolve_driver_path(state_file, max_age_days=DRIVER_PATH_MAX_AGE_DAYS):
+    # 保存済みのパスが新しければそのまま使い、古ければ ChromeDriverManager に確認し直す
+    state = load_json(state_file, {})
+    cached = state.get('path')
+    usable = cached and os.path.exists(cached)
+    if usable and time.time() - state.get('resolved_at', 0) < max_age_days * 86400:
+        return cached
+    try:
+        with metrics.timer('browser.driver_install'):
+            path = ChromeDriverManager().install()
+    except Exception as e:
+        if not usable:
+            raise
+        print(f"  -> ⚠️ ChromeDriver の確認に失敗したため、前回のドライバーを使います: {e}")
+        return cached
+    save_json(state_file, {'path': path, 'resolved_at': time.time()})
+    return path
+
+
+# 同じ Cookie ファイルに複数の Chrome（ワーカー）が書くので、読んで足して書く間は1つずつにする
+COOKIE_LOCK = threading.Lock()
+
+
+class BrowserSession:
+    # worker: ワーカー番号（worker_session() が付ける）。ワーカー用の Chrome は起動済みの Chrome に接続せず、
+    #         次のスクリプトにも残さない
+    def __init__(self, state_dir='.cache/browser', keep_alive=False, debug_port=DEBUG_PORT, worker=None):
+        self.state_dir = state_dir
+        self.keep_alive = keep_alive and worker is None
+        self.debug_port = debug_port
+        self.worker = worker
+        self.driver_state_file = os.path.join(state_dir, 'driver.json')
+        self.session_file = os.path.join(state_dir, 'session.json')
+        self.cookie_file = os.path.join(state_dir, 'cookies.json')
+        profile = 'profile' if worker is None else os.path.join('workers', str(worker))
+        self.profile_dir = os.path.abspath(os.path.join(state_dir, profile))
+        self.lock = threading.RLock()
+        self._driver = None
+        self.attached = False
+
+    def worker_session(self, index):
+        # 並列に取得するワーカー用の、別のプロフィールの Chrome（必要になるまで起動しない）
+        return BrowserSession(self.state_dir, worker=index)
+
+    def driver(self):
+        # ブラウザは本当に必要になるまで起動しない（前のスクリプトが残した Chrome があれば接続する）
+        with self.lock:
+            if self._driver is None:
+                with metrics.timer('fetch.driver_start'):
+                    self._driver = (self._attach() if self.worker is None else None) or self._launch()
+            return self._driver
+
+    def _attach(self):
+        port = load_json(self.session_file, {}).get('port')
+        if not port:
+            return None
+        try:
+            requests.get(f"http://127.0.0.1:{port}/json/version", timeout=2).raise_for_status()
+        except requests.RequestException:
+            # Chrome はもう閉じられている
+            os.remove(self.session_file)
+            return None
+        options = webdriver.ChromeOptions()
+        options.debugger_address = f"127.0.0.1:{port}"
+        try:
+            driver = webdriver.Chrome(service=ChromeService(resolve_driver_path(self.driver_state_file)), options=options)
+        except Exception as e:
+            print(f"  -> ⚠️ 起動済みの Chrome に接続できないため、新しく起動します: {e}")
+            return None
+        self.attached = True
+        self.debug_port = port
+        metrics.count('browser.attached')
+        print(f"  -> 🌐 起動済みの Chrome（ポート {port}）を使い回します")
+        return driver
+
+    def _launch(self):
+        options = webdriver.ChromeOptions()
+        if os.path.exists(CHROME_BINARY):
+            options.binary_location = CHROME_BINARY
+
+        # 成功したステルス設定（ロボット検知回避）
+        options.add_argument('--disable-blink-features=AutomationControlled')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option('useAutomationExtension', False)
+        options.add_argument(f"user-agent={USER_AGENT}")
+
+        # Cookie（チャレンジの解除状態を含む）とキャッシュを次回に残す
+        options.add_argument(f"--user-data-dir={self.profile_dir}")
+        if self.keep_alive:
+            # ドライバーが終了しても Chrome を閉じず、次のスクリプトがこのポートから接続する
+            options.add_argument(f"--remote-debugging-port={self.debug_port}")
+            options.add_experimental_option('detach', True)
+
+        driver = webdriver.Chrome(service=ChromeService(resolve_driver_path(self.driver_state_file)), options=options)
+
+        # WebDriverであることを隠すJavascript
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+        if self.keep_alive:
+            save_json(self.session_file, {'port': self.debug_port, 'started_at': time.time()})
+        if self.worker is not None:
+            self._seed_cookies(driver)
+        metrics.count('browser.launched')
+        return driver
+
+    def _seed_cookies(self, driver):
+        # ワーカーのプロフィールにも、チャレンジを解除した時の Cookie を入れておく（ページを開く前なので CDP で入れる）
+        cookies = self.saved_cookies()
+        if not cookies:
+            return
+        try:
+            driver.execute_cdp_cmd('Network.setCookies', {'cookies': [to_cdp_cookie(cookie) for cookie in cookies]})
+        except Exception as e:
+            print(f"  -> ⚠️ ワーカー {self.worker} の Chrome に Cookie を入れられませんでした: {e}")
+
+    def saved_cookies(self):
+        return load_json(self.cookie_file, [])
+
+    def save_cookies(self, cookies=None):
+        # 保存済みの Cookie に足して保存する（他のワーカーの Chrome が保存した Cookie を消さない）
+        with self.lock:
+            if cookies is None:
+                if self._driver is None:
+                    return
+                cookies = self._driver.get_cookies()
+            with COOKIE_LOCK:
+                merged = {(c.get('domain'), c.get('path'), c['name']): c for c in self.saved_cookies()}
+                merged.update(((c.get('domain'), c.get('path'), c['name']), c) for c in cookies)
+                save_json(self.cookie_file, list(merged.values()))
+
+    def close(self):
+        with self.lock:
+            if self._driver is None:
+                return
+            try:
+                self.save_cookies()
+            except Exception as e:
+                print(f"  -> ⚠️ Cookie を保存できませんでした: {e}")
+            if self.keep_alive:
+                # ドライバーだけ止めて、Chrome は次のスクリプトのために残す
+                self._driver.service.stop()
+                print(f"🌐 Chrome は開いたままにします（次のスクリプトが使い回します / ポート {self.debug_port}）")
+            else:
+                # 接続しただけの Chrome も閉じる（quit だけでは閉じない場合がある）
+                for close in (lambda: self._driver.execute_cdp_cmd('Browser.close', {}), self._driver.quit):
+                    try:
+                        close()
+                    except Exception:
+                        pass
+                if self.worker is None and os.path.exists(self.session_file):
+                    os.remove(self.session_file)
+            self._driver = None
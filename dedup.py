@@ -0,0 +1,193 @@
+import hashlib
+import random
+import re
+
+# 同じ問題の別スレッド（URLは違うが問題文と選択肢がほぼ同じ）をまとめる
+#
+# 問題文と選択肢を正規化（小文字・英数字の単語だけ・先頭の "Question N:" を除く・選択肢は並べ替え）し、
+# 3語ずつの shingle の集合にして MinHash の署名を作ります。署名を BANDS 個の帯に分けたバケット（LSH）で
+# 候補を絞り、候補とだけ shingle の集合の Jaccard 係数を比べるので、問題数が増えても全組み合わせの比較はしません。
+# 係数が threshold 以上なら重複とみなし、先に出てきた問題（代表）にまとめます。
+#
+# 代表の問題には、重複したスレッドの投票を足し合わせた投票と、重複したスレッドの一覧を持たせます。
+# 選択肢の順番がスレッドごとに違っても、選択肢の文で対応を取って投票の記号を代表の記号に読み替えます。
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# shingle の64ビットのハッシュに乱数のマスクを XOR したものを「並べ替え」として使う
+# （候補は後で Jaccard 係数を計算して確かめるので、簡易な並べ替えで十分。min(map(...)) で速く計算できる）
+_rng = random.Random(1103)
+MASKS = [_rng.getrandbits(64) for _ in range(NUM_PERM)]
+
+QUESTION_PREFIX_RE = re.compile(r'^\s*question\s*#?\s*\d+\s*[:.]?')
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_words(text):
+    return WORD_RE.findall(QUESTION_PREFIX_RE.sub('', text.lower()))
+
+
+def choice_letter(choice):
+    return choice['letter'].strip().rstrip('.').strip()[:1].upper()
+
+
+def choice_key(choice):
+    return " ".join(normalize_words(choice['text']))
+
+
+def question_words(record):
+    words = normalize_words(record['stem'])
+    for text in sorted(choice_key(choice) for choice in record['choices']):
+        words += text.split()
+    return words
+
+
+def hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def shingles(words):
+    if len(words) < SHINGLE_SIZE:
+        return {hash64(" ".join(words))} if words else set()
+    return {hash64(" ".join(words[i:i + SHINGLE_SIZE])) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    return [min(map(mask.__xor__, shingle_set)) for mask in MASKS]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def summarize(record):
+    # 投票をまとめるのに必要な分だけ持っておく（レコード全体は持たない）
+    return {
+        'num': record['num'],
+        'url': record['url'],
+        'votes': record['votes'],
+        'letters': {choice_letter(choice): choice_key(choice) for choice in record['choices']},
+    }
+
+
+def translate_choice(vote_choice, letters, to_letter):
+    # "AB" のような複数選択の投票も、1文字ずつ代表の記号に読み替える（対応が取れなければ None）
+    mapped = []
+    for letter in vote_choice:
+        target = to_letter.get(letters.get(letter))
+        if target is None:
+            return None
+        mapped.append(target)
+    return "".join(sorted(mapped))
+
+
+def merge_votes(canonical, duplicates):
+    # 票数が分かる投票は足し合わせて割合を計算し直す。票数が分からないスレッドしかなければ割合を平均する
+    # 両方ある時は、票数の分からないスレッドを「票数が分かるスレッドの平均の票数」が入ったものとみなして割合から票数を見積もり、
+    # 見積もりを含む投票には 'estimated': True を付ける（カードには「約N票」と出す）
+    to_letter = {text: letter for letter, text in canonical['letters'].items()}
+    threads = []
+    for summary in [canonical] + duplicates:
+        votes = []
+        for vote in summary['votes']:
+            choice = vote['choice'] if summary is canonical else translate_choice(vote['choice'], summary['letters'], to_letter)
+            if choice is not None:
+                votes.append((choice, vote))
+        if votes:
+            threads.append((votes, all(vote['votes'] is not None for _, vote in votes)))
+
+    counted = [votes for votes, has_counts in threads if has_counts]
+    if not counted:
+        percents = {}
+        for votes, _ in threads:
+            for choice, vote in votes:
+                percents.setdefault(choice, []).append(vote['percent'])
+        merged = [{'choice': choice, 'percent': round(sum(p) / len(p)), 'votes': None} for choice, p in percents.items()]
+    else:
+        weight = sum(vote['votes'] for votes in counted for _, vote in votes) / len(counted)
+        counts, estimated = {}, set()
+        for votes, has_counts in threads:
+            for choice, vote in votes:
+                counts[choice] = counts.get(choice, 0) + (vote['votes'] if has_counts else vote['percent'] * weight / 100)
+                if not has_counts:
+                    estimated.add(choice)
+        total = sum(counts.values())
+        merged = []
+        for choice, n in counts.items():
+            vote = {'choice': choice, 'percent': round(100 * n / total) if total else 0, 'votes': round(n)}
+            if choice in estimated:
+                vote['estimated'] = True
+            merged.append(vote)
+    # 投票は多い順（analyze_votes は先頭を最多投票として扱う）
+    merged.sort(key=lambda vote: (-(vote['votes'] or 0), -vote['percent'], vote['choice']))
+    return merged
+
+
+class DuplicateIndex:
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self.buckets = {}    # (帯の番号, 帯の値) -> [代表のキー, ...]
+        self.shingles = {}   # 代表のキー -> shingle の集合
+
+    def add(self, key, record):
+        # 重複なら代表のキーを返し、そうでなければ代表として登録して None を返す
+        shingle_set = shingles(question_words(record))
+        if not shingle_set:
+            return None
+        signature = minhash(shingle_set)
+        bands = [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+        best, best_score = None, self.threshold
+        seen = set()
+        for band in bands:
+            for candidate in self.buckets.get(band, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = jaccard(shingle_set, self.shingles[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        if best is not None:
+            return best
+
+        self.shingles[key] = shingle_set
+        for band in bands:
+            self.buckets.setdefault(band, []).append(key)
+        return None
+
+
+class DedupPlan:
+    def __init__(self):
+        self.duplicate_of = {}  # 重複した問題の連番 -> 代表の連番
+        self.merged = {}        # 代表の連番 -> {'votes': 足し合わせた投票, 'duplicates': [{'num', 'url'}, ...]}
+        self.records_file = None  # 重複探しで解析したレコードを書いたファイル（呼び出し側が本処理でそれを読む場合）
+
+    def __len__(self):
+        return len(self.duplicate_of)
+
+    def summary(self):
+        return f"重複スレッド: {len(self.duplicate_of)} 件を {len(self.merged)} 問にまとめました（翻訳・AI解説は代表の1件だけ）"
+
+
+def find_duplicates(items, threshold=0.85):
+    # items: (連番, レコード) を入力順に。先に出てきた方を代表にする
+    index = DuplicateIndex(threshold)
+    summaries = {}
+    groups = {}
+    plan = DedupPlan()
+    for seq, record in items:
+        canonical = index.add(seq, record)
+        if canonical is None:
+            summaries[seq] = summarize(record)
+            continue
+        plan.duplicate_of[seq] = canonical
+        groups.setdefault(canonical, []).append(summarize(record))
+
+    for canonical, duplicates in groups.items():
+        plan.merged[canonical] = {
+            'votes': merge_votes(summaries[canonical], duplicates),
+            'duplicates': [{'num': d['num'], 'url': d['url']} for d in duplicates],
+        }
+    return plan
@@ -0,0 +1,149 @@
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Gemini API のローカル代役サーバー（API枠を使わずに動作確認する用）
+#
+#   POST /v1beta/models/<model>:generateContent  -> 決まった形式の解説を返す
+#
+# rpm を指定すると、直近60秒のリクエスト数がそれを超えた時に本物と同じ形式の 429
+# （RESOURCE_EXHAUSTED + retryDelay）を返します。同時に処理中だったリクエスト数の最大値も記録します。
+# モデルの稼働確認（model_probe.py）の確認用に、モデルごとの処理時間（model_latency）、
+# 存在しないモデル（unavailable -> 404）、枠を使い切ったモデル（exhausted -> 常に 429）も指定できます。
+#
+# 使い方:
+#   python3 fake_gemini.py 8766
+#   GEMINI_API_KEY=dummy GEMINI_BASE_URL=http://127.0.0.1:8766 python3 03_generate_study_kit.py
+
+
+def bare_model(model):
+    # "models/gemini-2.5-pro" と "gemini-2.5-pro" を同じものとして扱う
+    return model.split('/')[-1]
+
+
+class FakeGemini:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rpm=None, retry_delay=1, reply=None,
+                 model_latency=None, unavailable=(), exhausted=()):
+        self.latency = latency          # 1リクエストの処理時間（秒）
+        self.model_latency = {bare_model(m): t for m, t in (model_latency or {}).items()}  # モデルごとの処理時間（秒）
+        self.unavailable = {bare_model(m) for m in unavailable}
+        self.exhausted = {bare_model(m) for m in exhausted}
+        self.rpm = rpm                  # None = 制限なし
+        self.retry_delay = retry_delay  # 429 の retryDelay（秒）
+        self.reply = reply or (lambda model, prompt: f"正解: A\n解説: ({model}) ダミーの解説です。")
+        self.lock = threading.Lock()
+        self.requests = []              # 受け付けた generateContent の (時刻, モデル)
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                match = re.search(r'/models/([^/:]+):generateContent', self.path)
+                if not match:
+                    self._send(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+                    return
+                status, payload = server.generate(match.group(1), body)
+                self._send(status, payload)
+
+            def _send(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.handler_class = Handler
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _is_over_limit(self, now):
+        if self.rpm is None:
+            return False
+        recent = [t for t, _ in self.requests if now - t < 60]
+        return len(recent) >= self.rpm
+
+    def generate(self, model, body):
+        now = time.monotonic()
+        model = bare_model(model)
+        if model in self.unavailable:
+            return 404, {'error': {
+                'code': 404,
+                'message': f"models/{model} is not found for API version v1beta, or is not supported for generateContent.",
+                'status': 'NOT_FOUND',
+            }}
+        with self.lock:
+            if model in self.exhausted or self._is_over_limit(now):
+                self.rate_limited += 1
+                return 429, {'error': {
+                    'code': 429,
+                    'message': 'You exceeded your current quota. Please retry later.',
+                    'status': 'RESOURCE_EXHAUSTED',
+                    'details': [{'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': f"{self.retry_delay}s"}],
+                }}
+            self.requests.append((now, model))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            time.sleep(self.model_latency.get(model, self.latency))
+            prompt = "".join(part.get('text', '') for c in body.get('contents', []) for part in c.get('parts', []))
+            text = self.reply(model, prompt)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+        return 200, {
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP'}],
+            'usageMetadata': {
+                'promptTokenCount': len(prompt) // 3,
+                'candidatesTokenCount': len(text) // 3,
+                'totalTokenCount': (len(prompt) + len(text)) // 3,
+            },
+            'modelVersion': model,
+        }
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8766
+    server = FakeGemini(port=port)
+    print(f"🧪 Gemini代役サーバー起動: {server.base_url}")
+    print(f"   GEMINI_BASE_URL={server.base_url} を指定してスクリプトを実行してください。Ctrl+C で終了。")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
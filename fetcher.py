@@ -0,0 +1,196 @@
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# ページ取得エンジン
+#
+#   'http'     : keep-alive の HTTP クライアントだけで取得（ブラウザを起動しない）
+#   'selenium' : 従来どおり Chrome で取得
+#   'auto'     : まず HTTP で取得し、Cloudflare 等のチャレンジページが返ってきたURLだけ Chrome で取り直す
+#
+# 環境変数 EXAMTOPICS_BASE_URL を指定すると、https://www.examtopics.com 宛てのURLを
+# そのアドレスに向け直します（fixture_server.py のローカル代役サーバーで動作確認する用）。
+
+SITE_ORIGIN = 'https://www.examtopics.com'
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+
+# チャレンジページ（「人間ですか？」）に含まれる目印
+# Cloudflare は普通のページにも /cdn-cgi/challenge-platform/scripts/jsd/main.js を埋め込むので、
+# 'challenge-platform' のようにどのページにも出る文字列は目印にしない（チャレンジの画面そのものの目印だけ）
+CHALLENGE_MARKERS = [
+    '<title>just a moment...</title>',
+    '<title>attention required! | cloudflare</title>',
+    'cf-chl-',
+    'cf_chl_opt',
+    'challenge-form',
+    'cf-browser-verification',
+]
+CHALLENGE_STATUS_CODES = (403, 429, 503)
+
+
+class ChallengeDetected(Exception):
+    pass
+
+
+def is_challenge_page(html, status_code=200):
+    if status_code in CHALLENGE_STATUS_CODES:
+        return True
+    lowered = html.lower()
+    return any(marker in lowered for marker in CHALLENGE_MARKERS)
+
+
+def rewrite_url(url, base_url=None):
+    base_url = base_url or os.getenv('EXAMTOPICS_BASE_URL')
+    if base_url and url.startswith(SITE_ORIGIN):
+        return base_url.rstrip('/') + url[len(SITE_ORIGIN):]
+    return url
+
+
+class HttpFetcher:
+    name = 'http'
+
+    def __init__(self, pool_size=10, timeout=30, base_url=None):
+        self.timeout = timeout
+        self.base_url = base_url
+        self.session = requests.Session()
+        # 同じホストへの接続を使い回す（keep-alive）
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+        })
+
+    def fetch(self, url):
+        with metrics.timer('fetch.http'):
+            response = self.session.get(rewrite_url(url, self.base_url), timeout=self.timeout)
+        if is_challenge_page(response.text, response.status_code):
+            metrics.count('fetch.challenge')
+            raise ChallengeDetected(f"チャレンジページを検出 (HTTP {response.status_code}): {url}")
+        response.raise_for_status()
+        return response.text
+
+    def load_cookies(self, cookies):
+        # Chrome の Cookie（チャレンジを解除した時のものを含む）を HTTP の取得にも使う
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumFetcher:
+    name = 'selenium'
+
+    # browser: browser.BrowserSession（ワーカーごとに別の Chrome。01 と共有する引き継ぎ用の1台は操作を1つずつ行う）
+    # page_wait: 読み込み後の固定のランダム待機（秒）。None なら待たない（間隔は AdaptivePacer に任せる）
+    # challenge_timeout: チャレンジページが出た時に、解除される（手動でクリックする）のを待つ最大秒数
+    def __init__(self, browser, page_wait=None, base_url=None, challenge_timeout=30):
+        self.browser = browser
+        self.page_wait = page_wait
+        self.base_url = base_url
+        self.challenge_timeout = challenge_timeout
+        self.challenged = False
+        self.cookies = []
+
+    def fetch(self, url):
+        with self.browser.lock:
+            return self._fetch(self.browser.driver(), url)
+
+    def _fetch(self, driver, url):
+        with metrics.timer('fetch.selenium'):
+            driver.get(rewrite_url(url, self.base_url))
+
+        if self.page_wait:
+            # ページ読み込み＆ブロック回避のための待機
+            wait = random.uniform(*self.page_wait)
+            metrics.observe('fetch.page_wait', wait)
+            time.sleep(wait)
+
+        # チャレンジページなら、解除されるまで（最大 challenge_timeout 秒）待つ
+        page_source = driver.page_source
+        self.challenged = is_challenge_page(page_source)
+        if self.challenged:
+            metrics.count('fetch.challenge')
+            print("  -> 『人間ですか？』が表示されています。解除されるのを待っています...")
+            deadline = time.monotonic() + self.challenge_timeout
+            with metrics.timer('fetch.challenge_wait'):
+                while is_challenge_page(page_source) and time.monotonic() < deadline:
+                    time.sleep(1)
+                    page_source = driver.page_source
+            if is_challenge_page(page_source):
+                raise ChallengeDetected(f"チャレンジページが解除されませんでした: {url}")
+
+        self.cookies = driver.get_cookies()
+        if self.challenged:
+            # 解除できた Cookie はすぐ保存して、次回の実行にも引き継ぐ
+            self.browser.save_cookies(self.cookies)
+        return page_source
+
+
+class Fetcher:
+    # engine に応じて HTTP / Chrome を使い分ける窓口
+    # fetch() は (html, 実際に使ったエンジン名) を返す
+    # pacer（pacing.AdaptivePacer）を渡すと、リクエストの前に間隔を空け、結果（応答時間・チャレンジ・エラー）を伝える
+    # browser（browser.BrowserSession）は呼び出し側が持ち、閉じるのも呼び出し側（複数の Fetcher で共有できる）
+    def __init__(self, engine, browser, page_wait=None, base_url=None, pacer=None):
+        if engine not in ('http', 'selenium', 'auto'):
+            raise ValueError(f"不明な取得エンジン: {engine}")
+        self.engine = engine
+        self.pacer = pacer
+        self.http = HttpFetcher(base_url=base_url) if engine != 'selenium' else None
+        self.browser = SeleniumFetcher(browser, page_wait, base_url) if engine != 'http' else None
+        if self.http is not None and self.browser is not None:
+            # 前回チャレンジを解除した時の Cookie があれば、HTTP でも最初から使う
+            self.http.load_cookies(browser.saved_cookies())
+
+    def fetch(self, url):
+        if self.http is not None:
+            try:
+                return self._paced_fetch(self.http, url), self.http.name
+            except ChallengeDetected as e:
+                if self.browser is None:
+                    raise
+                print(f"  -> {e} / Chromeで取り直します")
+            html = self._paced_fetch(self.browser, url)
+            # Chrome で通った Cookie を、以降の HTTP の取得にも使う
+            self.http.load_cookies(self.browser.cookies)
+            return html, self.browser.name
+        return self._paced_fetch(self.browser, url), self.browser.name
+
+    def _paced_fetch(self, engine, url):
+        if self.pacer is None:
+            return engine.fetch(url)
+        self.pacer.wait(url)
+        start = time.monotonic()
+        try:
+            html = engine.fetch(url)
+        except ChallengeDetected:
+            self.pacer.record(url, engine.name, challenge=True)
+            raise
+        except (requests.ConnectionError, requests.Timeout):
+            self.pacer.record(url, engine.name, ok=False)
+            raise
+        except requests.HTTPError as e:
+            # 5xx はサーバーが苦しい目印なので間隔を広げる（404 などはページの問題なので普通の応答として数える）
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status >= 500:
+                self.pacer.record(url, engine.name, ok=False)
+            else:
+                self.pacer.record(url, engine.name, time.monotonic() - start)
+            raise
+        # Chrome で一度チャレンジが出た（その後解除された）場合も、速度を落とす目印にする
+        challenged = getattr(engine, 'challenged', False)
+        self.pacer.record(url, engine.name, None if challenged else time.monotonic() - start, challenge=challenged)
+        return html
+
+    def close(self):
+        if self.http is not None:
+            self.http.close()
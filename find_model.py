@@ -1,68 +1,63 @@
 from google import genai
-import time
+from google.genai import types
 import os
+import sys
 from dotenv import load_dotenv # ★追加
+from model_probe import CANDIDATES, STATUS_LABELS, pick_model, probe_models, selected_model
 
 # --- 設定 ---
 load_dotenv() # .envファイルを読み込む
 API_KEY = os.getenv("GEMINI_API_KEY") # 環境変数から取得
+PROBE_FILE = '.cache/model_probe.json'  # 確認結果の保存先（03 の MODEL_ID = 'auto' もこれを使う）
 # ------------
 
-def check_available_models():
-    print("🚀 モデルの稼働状況をテスト中...\n")
-    
+# 使い方:
+#   python3 find_model.py            # 保存済みの結果が新しいモデルは確認し直さない
+#   python3 find_model.py --refresh  # 全候補を確認し直す
+
+def init_client():
+    # ローカルの代役サーバー（fake_gemini.py）を使う場合は GEMINI_BASE_URL を指定する
+    base_url = os.getenv("GEMINI_BASE_URL")
+    if base_url:
+        return genai.Client(api_key=API_KEY, http_options=types.HttpOptions(base_url=base_url))
+    return genai.Client(api_key=API_KEY)
+
+def check_available_models(refresh=False):
+    print("🚀 モデルの稼働状況をテスト中（全候補を同時に確認）...\n")
+
     if not API_KEY:
         print("❌ エラー: .envファイルが見つからないか、GEMINI_API_KEYが設定されていません。")
         return
 
     try:
-        client = genai.Client(api_key=API_KEY)
+        client = init_client()
     except Exception as e:
         print(f"初期化エラー: {e}")
         return
 
-    # テストしたい候補
-    candidates = [
-        "models/gemini-2.5-pro",
-        "models/gemini-3-pro-preview",
-        "models/gemini-2.5-flash",
-        "models/gemini-2.0-flash-exp",
-        "models/gemini-2.0-flash",
-        "models/gemini-flash-latest",
-    ]
+    # テストしたい候補は model_probe.CANDIDATES
+    results = probe_models(client, CANDIDATES, PROBE_FILE, refresh=refresh)
 
-    working_model = None
+    # 速い順に表示する（使えないモデルは後ろ）
+    order = sorted(results, key=lambda m: (results[m]['status'] != 'ok', results[m]['latency']))
+    for model_name in order:
+        result = results[model_name]
+        note = " (保存済み)" if result['cached'] else ""
+        line = f"👉 {model_name:<30} ... {STATUS_LABELS[result['status']]}  {result['latency']:.2f}秒{note}"
+        if result['status'] == 'error':
+            line += f": {result['error']}"
+        print(line)
 
-    for model_name in candidates:
-        print(f"👉 テスト中: {model_name:<30} ... ", end="")
-        
-        try:
-            # 実際に通信してみる
-            response = client.models.generate_content(
-                model=model_name,
-                contents="Hello"
-            )
-            print("✅ 成功！")
-            working_model = model_name
-            break 
-            
-        except Exception as e:
-            error_msg = str(e)
-            if "404" in error_msg:
-                print("❌ 見つかりません (404)")
-            elif "429" in error_msg:
-                print("⚠️ 容量オーバー (429)")
-            else:
-                print(f"❌ エラー: {error_msg}")
-        
-        time.sleep(1)
+    # 応答時間の小さな差では選び直さない（前回 03 が選んだモデル → 候補の順。明らかに遅いモデルだけ飛ばす）
+    working_model = pick_model(results, selected_model(PROBE_FILE))
 
     print("\n------------------------------------------------")
     if working_model:
         print(f"🎉 決定！ このモデルIDが使えます:")
         print(f"\nMODEL_ID = '{working_model}'\n")
+        print(f"（03 で MODEL_ID = 'auto' にすると、起動時に {PROBE_FILE} の結果から同じ規則で選びます）")
     else:
         print("😢 有効なモデルが見つかりませんでした。")
 
 if __name__ == "__main__":
-    check_available_models()
\ No newline at end of file
+    check_available_models(refresh='--refresh' in sys.argv[1:])
@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from fetcher import SITE_ORIGIN
+
+# 録画済みページを返す、ExamTopics のローカル代役サーバー
+#
+# fixtures ディレクトリの <URLのパス>/index.html を、そのパスへのレスポンスとして返します。
+#   例) fixtures/discussions/servicenow/1/index.html  ->  /discussions/servicenow/1/
+#
+# 使い方:
+#   python3 fixture_server.py fixtures 8765
+#   EXAMTOPICS_BASE_URL=http://127.0.0.1:8765 python3 02_scrape_raw.py
+#
+# 取得済みページのキャッシュ（.cache/pages）から fixtures を作ることもできます:
+#   python3 fixture_server.py --export .cache/pages fixtures
+
+CLEARANCE_COOKIE = 'cf_clearance'  # この Cookie を付けたリクエストにはチャレンジページを返さない（解除済みの再現）
+CHALLENGE_HTML = ("<html><head><title>Just a moment...</title></head><body>"
+                  "<script>window._cf_chl_opt={cType: 'managed'};</script>"
+                  "<form id='challenge-form' action='/?__cf_chl_f_tk=0' method='POST'></form></body></html>")
+
+
+def fixture_path(root, url_path):
+    parts = [p for p in url_path.split('/') if p and p not in ('.', '..')]
+    return os.path.join(root, *parts, 'index.html')
+
+
+class FixtureServer:
+    # challenge_paths に入れたパスには、CLEARANCE_COOKIE がない限りチャレンジページ（503）を返す
+    def __init__(self, root, host='127.0.0.1', port=0, challenge_paths=()):
+        self.root = root
+        self.challenge_paths = set(challenge_paths)
+        self.hits = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                with server.lock:
+                    server.hits[path] = server.hits.get(path, 0) + 1
+
+                if path in server.challenge_paths and CLEARANCE_COOKIE + '=' not in self.headers.get('Cookie', ''):
+                    self._send(503, CHALLENGE_HTML)
+                    return
+
+                file_path = fixture_path(server.root, path)
+                if not os.path.exists(file_path):
+                    self._send(404, "<html><body>Not Found</body></html>")
+                    return
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    self._send(200, f.read())
+
+            def _send(self, status, body):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def export_from_cache(cache_dir, root):
+    from page_cache import PageCache, STATUS_OK
+
+    cache = PageCache(cache_dir)
+    count = 0
+    for url, entry in cache.index.items():
+        if entry.get('status') != STATUS_OK or not url.startswith(SITE_ORIGIN):
+            continue
+        html = cache.get(url)
+        if html is None:
+            continue
+        path = fixture_path(root, urlparse(url).path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        count += 1
+    return count
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--export':
+        count = export_from_cache(sys.argv[2], sys.argv[3])
+        print(f"📦 {count} ページを '{sys.argv[3]}' に書き出しました。")
+        return
+
+    root = sys.argv[1] if len(sys.argv) > 1 else 'fixtures'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    server = FixtureServer(root, port=port)
+    print(f"🧪 代役サーバー起動: {server.base_url} (fixtures: {root})")
+    print(f"   EXAMTOPICS_BASE_URL={server.base_url} を指定してスクリプトを実行してください。Ctrl+C で終了。")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 描画済みカードの保存（教科書の差分ビルド用）
+#
+# キー（内容ハッシュ）は「ビルドの指紋 + 問題の元データ（問題ストアの1行 or カードのHTML）」のハッシュです。
+# ビルドの指紋には描画に関わる設定と関数のソースを入れるので、問題・設定・描画処理のどれかが変われば別のキーになり、
+# そのカードだけ作り直されます。変わっていないカードは解析・翻訳・AI解説・描画をせずに、保存済みのHTMLをそのまま使います。
+#
+#   <root>/manifest.json                     : {"version": 3, "fragments": {内容ハッシュ: {"num", "sha256", "build", "built_at", "meta"}},
+#                                               "pending": [問題番号, ...]}
+#   <root>/<ハッシュ先頭2文字>/<ハッシュ>.html  : 描画済みのカード
+# "meta" はカード以外の出力の材料（検索用の索引の語・Excelノートの行など）で、再利用するカードの分もそれらを作り直せるように持っておきます。
+# "pending" は直前の実行で保存しなかった（翻訳・AI解説の失敗などで、次の実行で作り直す）カードの問題番号です（run_all.py が見る）。
+
+MANIFEST_VERSION = 3
+
+
+def content_hash(build, source):
+    if isinstance(source, dict):
+        source = json.dumps(source, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256((build + "\n" + source).encode('utf-8')).hexdigest()
+
+
+def load_manifest(path, warn=False):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        if warn:
+            print(f"⚠️ ビルドの記録が読めないため全問を作り直します: {e}")
+        return {}
+    return manifest if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def pending_fragments(root):
+    # 直前の実行で保存しなかったカードの問題番号
+    return load_manifest(os.path.join(root, 'manifest.json')).get('pending', [])
+
+
+class FragmentCache:
+    def __init__(self, root, build, enabled=True):
+        self.root = root
+        self.build = build
+        self.enabled = enabled            # False = 保存済みのカードを使わない（作り直して保存はする）
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.used = set()
+        self.pending = []
+        self.fragments = load_manifest(self.manifest_path, warn=True).get('fragments', {})
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.html')
+
+    def key(self, source):
+        return content_hash(self.build, source)
+
+    def get(self, key):
+        # (問題番号, カードのHTML, meta) を返す。記録がない・ファイルが壊れている場合は None
+        with self.lock:
+            entry = self.fragments.get(key) if self.enabled else None
+        html = None
+        if entry is not None:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() == entry['sha256']:
+                    html = data.decode('utf-8')
+            except OSError:
+                pass
+        with self.lock:
+            if html is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.used.add(key)
+            return entry['num'], html, entry.get('meta')
+
+    def put(self, key, num, html, meta=None):
+        data = html.encode('utf-8')
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.fragments[key] = {
+                'num': num,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'build': self.build,
+                'built_at': time.time(),
+                'meta': meta,
+            }
+            self.used.add(key)
+
+    def skip(self, num):
+        # 作り直しが必要なので保存しなかったカード
+        with self.lock:
+            self.pending.append(num)
+
+    def save(self, prune=False):
+        # prune=True（全問を処理した時）は、今回使わなかったカードを記録とディスクから消す
+        # それ以外でも、今のビルドの指紋と違うカードは二度と使われないので消す
+        with self.lock:
+            removed = [key for key, entry in self.fragments.items()
+                       if entry.get('build') != self.build or (prune and key not in self.used)]
+            for key in removed:
+                del self.fragments[key]
+            manifest = {'version': MANIFEST_VERSION, 'fragments': self.fragments, 'pending': sorted(self.pending)}
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+        for key in removed:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return len(removed)
+
+    def summary(self):
+        note = f" / 失敗などで保存せず次回も作り直す {len(self.pending)} 問" if self.pending else ""
+        return f"差分ビルド: 変更なしで再利用 {self.hits} 問 / 作り直し {self.misses} 問{note}"
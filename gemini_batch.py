@@ -0,0 +1,211 @@
+import json
+import os
+import time
+import uuid
+
+# Gemini のバッチモード（全問をまとめて1つのジョブとして投げる）
+#
+# 1. 今回AI解説が必要な問題のプロンプトを、1問1行の JSONL（バッチジョブのファイル）に書き出して投入する
+# 2. ジョブ名などを状態ファイルに保存する（スクリプトを終了しても、次回の実行で続きから待てる）
+# 3. ジョブが終わったら結果を「結果ファイル」(JSONL) に書き出す
+#    結果ファイルは問題番号・問題文・モデル・プロンプトのハッシュを含むので、後の実行でオフラインにマージできる
+#
+# バックエンドは本物の Gemini（GeminiBatchBackend）と、ローカルで動きを再現する LocalBatchBackend の2つ。
+
+FINISHED_STATES = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED')
+SUCCEEDED_STATES = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED')
+
+
+class GeminiBatchBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, job_file, model, display_name):
+        from google.genai import types
+
+        uploaded = self.client.files.upload(
+            file=job_file,
+            config=types.UploadFileConfig(display_name=display_name, mime_type='jsonl'),
+        )
+        job = self.client.batches.create(model=model, src=uploaded.name, config={'display_name': display_name})
+        return job.name
+
+    def state(self, job_name):
+        job = self.client.batches.get(name=job_name)
+        return job.state.name if job.state else 'JOB_STATE_UNSPECIFIED'
+
+    def download_results(self, job_name):
+        job = self.client.batches.get(name=job_name)
+        data = self.client.files.download(file=job.dest.file_name)
+        return data.decode('utf-8')
+
+
+class LocalBatchBackend:
+    # ローカルでバッチジョブを再現する代役（テスト・動作確認用）
+    # 投入から delay 秒たつと完了し、answer_fn(model, prompt) の返り値を結果として返す
+    def __init__(self, root, answer_fn, delay=0.0):
+        self.root = root
+        self.answer_fn = answer_fn
+        self.delay = delay
+        os.makedirs(root, exist_ok=True)
+
+    def _meta_path(self, job_name):
+        return os.path.join(self.root, job_name + '.json')
+
+    def submit(self, job_file, model, display_name):
+        job_name = f"batches/local-{uuid.uuid4().hex[:12]}"
+        meta = {'model': model, 'job_file': os.path.abspath(job_file), 'submitted_at': time.time()}
+        os.makedirs(os.path.dirname(self._meta_path(job_name)), exist_ok=True)
+        with open(self._meta_path(job_name), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return job_name
+
+    def _meta(self, job_name):
+        with open(self._meta_path(job_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def state(self, job_name):
+        if not os.path.exists(self._meta_path(job_name)):
+            return 'JOB_STATE_FAILED'
+        meta = self._meta(job_name)
+        if time.time() - meta['submitted_at'] < self.delay:
+            return 'JOB_STATE_RUNNING'
+        return 'JOB_STATE_SUCCEEDED'
+
+    def download_results(self, job_name):
+        meta = self._meta(job_name)
+        lines = []
+        for request in read_jsonl(meta['job_file']):
+            prompt = request['request']['contents'][0]['parts'][0]['text']
+            text = self.answer_fn(meta['model'], prompt)
+            response = {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+            lines.append(json.dumps({'key': request['key'], 'response': response}, ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def response_text(result):
+    # 結果ファイルの1行から解説テキストを取り出す（エラー行は None）
+    response = result.get('response')
+    if not response:
+        return None
+    try:
+        parts = response['candidates'][0]['content']['parts']
+    except (KeyError, IndexError, TypeError):
+        return None
+    text = "".join(part.get('text', '') for part in parts).strip()
+    return text or None
+
+
+class BatchRunner:
+    def __init__(self, backend, model, template_hash, state_file, job_file, results_file):
+        self.backend = backend
+        self.model = model
+        self.template_hash = template_hash
+        self.state_file = state_file
+        self.job_file = job_file
+        self.results_file = results_file
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def submit(self, requests):
+        # requests: [(問題番号, AIに渡す問題文, プロンプト), ...]
+        os.makedirs(os.path.dirname(self.job_file) or '.', exist_ok=True)
+        entries = {}
+        with open(self.job_file, 'w', encoding='utf-8') as f:
+            for num, question_text, prompt in requests:
+                key = f"q{num}"
+                # 同じ番号の問題が複数ある場合もキーが重ならないようにする
+                while key in entries:
+                    key += "_"
+                entries[key] = {'num': num, 'question_text': question_text}
+                line = {'key': key, 'request': {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}}
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+        job_name = self.backend.submit(self.job_file, self.model, f"cis-csm-ai-{int(time.time())}")
+        state = {
+            'job_name': job_name,
+            'model': self.model,
+            'template': self.template_hash,
+            'submitted_at': time.time(),
+            'requests': entries,
+        }
+        write_json(self.state_file, state)
+        return state
+
+    def poll(self, state, wait=False, interval=30):
+        # ジョブが終わっていれば結果ファイルに書き出して True を返す
+        while True:
+            job_state = self.backend.state(state['job_name'])
+            if job_state in FINISHED_STATES:
+                break
+            if not wait:
+                print(f"   ⏳ バッチジョブ {state['job_name']} は実行中です ({job_state})")
+                return False
+            print(f"   ⏳ バッチジョブ {state['job_name']} の完了待ち ({job_state}) ... {interval}秒後に再確認")
+            time.sleep(interval)
+
+        if job_state in SUCCEEDED_STATES:
+            self._write_results(state, self.backend.download_results(state['job_name']))
+        else:
+            print(f"   ❌ バッチジョブが失敗しました ({job_state})。次回の実行で未取得の問題を投入し直します。")
+        os.remove(self.state_file)
+        return True
+
+    def _write_results(self, state, raw_results):
+        # 結果ファイルには追記する（前回までの結果も残す）
+        count = 0
+        with open(self.results_file, 'a', encoding='utf-8') as f:
+            for line in raw_results.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                request = state['requests'].get(result.get('key'))
+                if request is None:
+                    continue
+                record = {
+                    'key': result['key'],
+                    'num': request['num'],
+                    'question_text': request['question_text'],
+                    'model': state['model'],
+                    'template': state['template'],
+                    'text': response_text(result),
+                    'error': result.get('error'),
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        print(f"   📥 バッチジョブの結果 {count} 件を '{self.results_file}' に保存しました。")
+
+    def merge_results(self, ai_cache, is_failure):
+        # 結果ファイルの解説をAI解説キャッシュに取り込む（同じモデル・プロンプトのものだけ）
+        if not os.path.exists(self.results_file):
+            return 0
+        merged = 0
+        for record in read_jsonl(self.results_file):
+            if record.get('model') != ai_cache.model or record.get('template') != ai_cache.template_hash:
+                continue
+            text = record.get('text')
+            if not text or is_failure(text):
+                continue
+            if ai_cache.peek(record['question_text']) != text:
+                ai_cache.put(record['question_text'], text)
+                merged += 1
+        return merged
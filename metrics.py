@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 実行時間と回数の計測（01〜03 と共通モジュールで共有する）
+#
+#   with metrics.timer('fetch.http'):   ...   # かかった時間をヒストグラムに記録（例外なら <名前>.errors も数える）
+#   metrics.count('fetch.challenge')          # 回数を数える
+#   metrics.observe('ai.backoff', seconds)    # 待った時間などを直接記録
+#
+# 記録はプロセス全体で1つ（REGISTRY）。スクリプトの最後に write_report() で JSON のレポートを書き出します。
+# タイマーの合計はスレッドの延べ時間なので、並列処理では実行時間（wall）の100%を超えることがあります。
+
+# ヒストグラムの区切り（秒）: 0.5ms から倍々で約10分まで
+BUCKET_BOUNDS = [0.0005 * 2 ** k for k in range(21)]
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(BUCKET_BOUNDS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, q):
+        # 区切りの上端で近似する（実際の最大値を超えないようにする）
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self, wall=None):
+        ms = lambda v: round(v * 1000, 3) if v is not None else None
+        result = {
+            'count': self.count,
+            'total_s': round(self.total, 4),
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'min_ms': ms(self.min),
+            'max_ms': ms(self.max),
+            'p50_ms': ms(self.percentile(0.50)),
+            'p90_ms': ms(self.percentile(0.90)),
+            'p99_ms': ms(self.percentile(0.99)),
+        }
+        if wall:
+            result['share'] = round(self.total / wall, 4)
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count(name + '.errors')
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def report(self, script, extra=None):
+        with self.lock:
+            finished_at = time.time()
+            wall = finished_at - self.started_at
+            return {
+                'script': script,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(finished_at)),
+                'wall_s': round(wall, 3),
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: h.to_dict(wall) for name, h in sorted(self.histograms.items())},
+                'extra': extra or {},
+            }
+
+    def write_report(self, path, script, extra=None):
+        report = self.report(script, extra)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+        return report
+
+
+REGISTRY = Registry()
+count = REGISTRY.count
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+
+def summary_lines(report, top=6):
+    # 時間のかかった処理の上位（延べ時間の多い順）
+    timers = sorted(report['timers'].items(), key=lambda item: item[1]['total_s'], reverse=True)[:top]
+    lines = [f"⏱️ 実行時間 {report['wall_s']:.1f}秒 の内訳（延べ時間の多い順）:"]
+    for name, t in timers:
+        lines.append(f"   {name:<22} {t['total_s']:9.2f}秒 ({t.get('share', 0):6.1%}) / {t['count']}回 / p90 {t['p90_ms']}ms")
+    return lines
+
+
+class Progress:
+    # 1行を上書きしながら進捗と残り時間の目安を表示する（total が分からなければ速度だけ）
+    def __init__(self, total, label, enabled=True, interval=0.5, stream=None):
+        self.total = total
+        self.label = label
+        self.enabled = enabled
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_draw = 0.0
+        self.drawn = 0
+        self.lock = threading.Lock()
+
+    def update(self, n=1):
+        with self.lock:
+            self.done += n
+            now = time.monotonic()
+            if self.enabled and (now - self.last_draw >= self.interval or self.done == self.total):
+                self.last_draw = now
+                self._draw(now)
+
+    def _draw(self, now):
+        self.drawn = self.done
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            remaining = (self.total - self.done) / rate if rate else None
+            eta = format_duration(remaining) if remaining is not None else "--:--"
+            text = f"{self.label}: {self.done}/{self.total} ({self.done / self.total:.0%}) {rate:.2f}件/秒 残り約 {eta}"
+        else:
+            text = f"{self.label}: {self.done}件 {rate:.2f}件/秒 経過 {format_duration(elapsed)}"
+        self.stream.write("\r📈 " + text + "   ")
+        self.stream.flush()
+
+    def close(self):
+        if self.enabled and self.done:
+            with self.lock:
+                if self.drawn != self.done:
+                    self._draw(time.monotonic())
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
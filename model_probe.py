@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+import metrics
+from ai_scheduler import is_rate_limited
+
+# Gemini モデルの稼働確認（find_model.py と 03 の MODEL_ID = 'auto' で共通）
+#
+# 候補のモデルに「1トークンだけ返す」安いリクエストを同時に送り、応答時間と状態を調べます。
+#   'ok'        : 使える（latency = 応答までの秒数）
+#   'quota'     : 429（RESOURCE_EXHAUSTED）。今は枠がない
+#   'not_found' : 404。このキーでは使えない / 存在しない
+#   'error'     : その他のエラー
+# 結果は接続先（GEMINI_BASE_URL）ごとに probe_file へ保存し、TTL の間は問い合わせ直しません。
+# 429 は時間が経てば戻るので、他より短い QUOTA_TTL で確認し直します。
+#
+# モデルを選ぶ時は応答時間だけでは決めません（1トークンの応答時間の差はほとんど誤差で、モデルが変わると
+# AI解説のキャッシュも描画済みカードも全て作り直しになり、API枠を使い直すため）。
+# 前回選んだモデル → CANDIDATES の順 に見て、使えて、一番速いモデルより「明らかに遅い」（SWITCH_FACTOR 倍以上、
+# かつ SWITCH_MIN_GAP 秒以上遅い）わけではない最初のモデルを選びます。選んだモデルは接続先ごとに probe_file に残します。
+#
+#   probe_file: {"results": {接続先: {モデル: {"status", "latency", "error", "checked_at"}}}, "selected": {接続先: モデル}}
+
+CANDIDATES = [
+    "models/gemini-2.5-pro",
+    "models/gemini-3-pro-preview",
+    "models/gemini-2.5-flash",
+    "models/gemini-2.0-flash-exp",
+    "models/gemini-2.0-flash",
+    "models/gemini-flash-latest",
+]
+PROBE_TTL = 6 * 3600   # 確認結果を使い回す時間（秒）
+QUOTA_TTL = 600        # 429 だったモデルを確認し直すまでの時間（秒）
+PROBE_TIMEOUT = 20     # 1モデルの確認を待つ上限（秒）
+SWITCH_FACTOR = 2.0    # 一番速いモデルよりこの倍数以上遅く、
+SWITCH_MIN_GAP = 0.5   # かつこの秒数以上遅い時だけ、前回のモデル（優先順の上のモデル）から乗り換える
+
+STATUS_LABELS = {
+    'ok': "✅ 成功",
+    'quota': "⚠️ 容量オーバー (429)",
+    'not_found': "❌ 見つかりません (404)",
+    'error': "❌ エラー",
+}
+
+
+def endpoint_name():
+    # 本物の API と代役サーバーの結果を混ぜない
+    return os.getenv("GEMINI_BASE_URL") or 'default'
+
+
+def is_not_found(error):
+    text = str(error)
+    return getattr(error, 'code', None) == 404 or "404" in text or "NOT_FOUND" in text
+
+
+def probe_model(client, model, timeout=PROBE_TIMEOUT):
+    config = types.GenerateContentConfig(
+        max_output_tokens=1,
+        http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+    )
+    started = time.monotonic()
+    try:
+        client.models.generate_content(model=model, contents="Hi", config=config)
+        status, error = 'ok', None
+    except Exception as e:
+        if is_rate_limited(e):
+            status = 'quota'
+        elif is_not_found(e):
+            status = 'not_found'
+        else:
+            status = 'error'
+        error = str(e)[:200]
+    latency = time.monotonic() - started
+    metrics.observe('model_probe.latency', latency)
+    metrics.count(f"model_probe.{status}")
+    return {'status': status, 'latency': round(latency, 3), 'error': error, 'checked_at': time.time()}
+
+
+def is_fresh(result, now, ttl=PROBE_TTL, quota_ttl=QUOTA_TTL):
+    age = now - result.get('checked_at', 0)
+    return age < (quota_ttl if result.get('status') == 'quota' else ttl)
+
+
+def load_probe_file(probe_file):
+    if not probe_file or not os.path.exists(probe_file):
+        return {}
+    try:
+        with open(probe_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_probe_file(probe_file, section, value):
+    # section（'results' / 'selected'）の、今の接続先の分だけを書き換える
+    data = load_probe_file(probe_file)
+    data.setdefault(section, {})[endpoint_name()] = value
+    os.makedirs(os.path.dirname(probe_file) or '.', exist_ok=True)
+    tmp_path = probe_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, probe_file)
+
+
+def selected_model(probe_file):
+    return load_probe_file(probe_file).get('selected', {}).get(endpoint_name())
+
+
+def probe_models(client, candidates=CANDIDATES, probe_file=None, refresh=False, ttl=PROBE_TTL, quota_ttl=QUOTA_TTL):
+    # {モデル: 結果} を返す。保存済みの結果が新しいモデルは問い合わせず、残りを同時に確認する
+    # 結果には保存済みのものを使ったかどうか（'cached'）を付ける（ファイルには保存しない）
+    saved = load_probe_file(probe_file).get('results', {}).get(endpoint_name(), {})
+    now = time.time()
+    stale = [model for model in candidates
+             if refresh or model not in saved or not is_fresh(saved[model], now, ttl, quota_ttl)]
+    if stale:
+        with metrics.timer('model_probe.total'):
+            with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+                saved.update(zip(stale, executor.map(lambda model: probe_model(client, model), stale)))
+        if probe_file:
+            update_probe_file(probe_file, 'results', saved)
+    return {model: dict(saved[model], cached=model not in stale) for model in candidates}
+
+
+def is_clearly_slower(latency, fastest):
+    return latency >= fastest * SWITCH_FACTOR and latency - fastest >= SWITCH_MIN_GAP
+
+
+def pick_model(results, previous=None):
+    # 前回のモデル → 候補の順に見て、使えて、一番速いモデルより明らかに遅くはない最初のモデル（使えるモデルがなければ None）
+    working = {model: result['latency'] for model, result in results.items() if result['status'] == 'ok'}
+    if not working:
+        return None
+    fastest = min(working.values())
+    for model in ([previous] if previous else []) + list(results):
+        if model in working and not is_clearly_slower(working[model], fastest):
+            return model
+
+
+def select_model(client, candidates=CANDIDATES, probe_file=None, fallback=None):
+    # 03 の起動時用: pick_model の規則でモデルを返す。クライアントがない・全部だめなら fallback
+    previous = selected_model(probe_file)
+    if client is None:
+        return previous or fallback or candidates[0]
+    results = probe_models(client, candidates, probe_file)
+    model = pick_model(results, previous)
+    if model is None:
+        model = previous or fallback or candidates[0]
+        print(f"⚠️ 使えるモデルが見つからないため {model} を使います（{format_counts(results)}）")
+        return model
+    if model == previous:
+        print(f"🤖 前回と同じモデルを使います: {model}（{results[model]['latency']:.2f}秒 / {format_counts(results)}）")
+    else:
+        reason = f"前回の {previous} が使えないか明らかに遅いため" if previous else "優先順で最初に使えるモデル"
+        print(f"🤖 モデルを選びました: {model}（{reason} / {results[model]['latency']:.2f}秒 / {format_counts(results)}）")
+        if probe_file:
+            update_probe_file(probe_file, 'selected', model)
+    return model
+
+
+def format_counts(results):
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return " / ".join(f"{status} {n}" for status, n in sorted(counts.items()))
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+import metrics
+
+# 学習用の Excel ノート（CIS-CSM_My_Notebook.xlsx）
+#
+# - ノートがなければ、openpyxl の write_only モードで行を流し込んで作る（全行をメモリに組み立てない）
+# - ノートがあれば、問題番号をキーにして「変わった問題」の行だけを書き換え、新しい問題は末尾に足す。
+#   書き換えるのは生成した列（GENERATED_COLUMNS）だけで、「自分の結論」「メモ」や自分で足した列はそのまま残る
+# - 前回書いた各行の内容ハッシュと行の位置を state_file に保存しておき、変わった問題がなければファイルを開きもしない
+#   （xlsx は1つの zip なので、書き換える時はファイル全体を保存し直すことになる）
+# 行を並べ替えたり削除したりしても、保存済みの位置に別の問題があれば問題番号の列を見て探し直します。
+
+SHEET_TITLE = 'Notebook'
+KEY_COLUMN = '問題番号'
+GENERATED_COLUMNS = [KEY_COLUMN, '状態', 'サイト解答', 'コミュニティ最多', '投票内訳', 'AI解答', '問題文', 'URL']
+USER_COLUMNS = ['自分の結論', 'メモ']
+COLUMN_WIDTHS = {'状態': 6, '投票内訳': 30, 'AI解答': 20, '問題文': 60, 'URL': 30, '自分の結論': 12, 'メモ': 40}
+HEADER_FILL = PatternFill('solid', fgColor='DDEBF7')
+USER_FILL = PatternFill('solid', fgColor='FFF2CC')
+
+
+def row_hash(row):
+    return hashlib.sha256(json.dumps(row, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def column_letter(index):
+    letters = ''
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+class NotebookWriter:
+    def __init__(self, path, state_file):
+        self.path = path
+        self.state_file = state_file
+        self.rows = {}  # 問題番号 -> GENERATED_COLUMNS の順の値
+        self.added = 0
+        self.updated = 0
+
+    def add(self, num, row):
+        self.rows[num] = row
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # 別のファイル向けの記録は使わない
+        return state.get('rows', {}) if state.get('path') == os.path.abspath(self.path) else {}
+
+    def _save_state(self, rows):
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(self.path), 'rows': rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_file)
+
+    def finish(self):
+        with metrics.timer('notebook.write'):
+            try:
+                if os.path.exists(self.path):
+                    self._merge()
+                else:
+                    self._write_new()
+            except PermissionError as e:
+                print(f"⚠️ ノートを保存できませんでした（Excelで開いている場合は閉じてから再実行してください）: {e}")
+                return False
+        return True
+
+    def _write_new(self):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(SHEET_TITLE)
+        columns = GENERATED_COLUMNS + USER_COLUMNS
+        for i, name in enumerate(columns, start=1):
+            if name in COLUMN_WIDTHS:
+                sheet.column_dimensions[column_letter(i)].width = COLUMN_WIDTHS[name]
+        sheet.freeze_panes = 'B2'
+
+        header = []
+        for name in columns:
+            cell = WriteOnlyCell(sheet, value=name)
+            cell.font = Font(bold=True)
+            cell.fill = USER_FILL if name in USER_COLUMNS else HEADER_FILL
+            header.append(cell)
+        sheet.append(header)
+
+        state = {}
+        for row_index, num in enumerate(sorted(self.rows), start=2):
+            row = self.rows[num]
+            sheet.append(row + [None] * len(USER_COLUMNS))
+            state[str(num)] = [row_index, row_hash(row)]
+        self._save(workbook)
+        self._save_state(state)
+        self.added = len(self.rows)
+
+    def _merge(self):
+        state = self._load_state()
+        changed = {num: row for num, row in self.rows.items()
+                   if state.get(str(num), [None, None])[1] != row_hash(row)}
+        if not changed:
+            return
+
+        workbook = load_workbook(self.path)
+        sheet = workbook[SHEET_TITLE] if SHEET_TITLE in workbook.sheetnames else workbook.active
+        header = {cell.value: cell.column for cell in sheet[1] if cell.value is not None}
+        # 生成する列がなくなっていたら（自分で消した場合など）右端に足し直す
+        for name in GENERATED_COLUMNS:
+            if name not in header:
+                header[name] = sheet.max_column + 1
+                sheet.cell(row=1, column=header[name], value=name).font = Font(bold=True)
+        key_column = header[KEY_COLUMN]
+
+        positions = None
+        next_row = sheet.max_row + 1
+        for num in sorted(changed):
+            row_index = state.get(str(num), [None])[0]
+            if row_index is None or sheet.cell(row=row_index, column=key_column).value != num:
+                if positions is None:
+                    # 行が並べ替えられている: 問題番号の列を1回だけ読んで位置を作り直す
+                    positions = {sheet.cell(row=r, column=key_column).value: r for r in range(2, sheet.max_row + 1)}
+                row_index = positions.get(num)
+            if row_index is None:
+                row_index = next_row
+                next_row += 1
+                self.added += 1
+            else:
+                self.updated += 1
+            for name, value in zip(GENERATED_COLUMNS, changed[num]):
+                # cell(value=None) では空にならないので代入する
+                sheet.cell(row=row_index, column=header[name]).value = value
+            state[str(num)] = [row_index, row_hash(changed[num])]
+
+        if positions is not None:
+            # 並べ替えで位置が変わった他の行の記録も直しておく
+            changed_keys = {str(num) for num in changed}
+            for key, (row_index, digest) in list(state.items()):
+                moved = positions.get(int(key)) if key.isdigit() else None
+                if moved is not None and key not in changed_keys:
+                    state[key] = [moved, digest]
+        self._save(workbook)
+        self._save_state(state)
+
+    def _save(self, workbook):
+        tmp_path = self.path + '.tmp.xlsx'
+        workbook.save(tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        if not self.added and not self.updated:
+            return f"Excelノート: 変更なし（{self.path}）"
+        return f"Excelノート: 追加 {self.added} 行 / 更新 {self.updated} 行（自分の結論・メモの列はそのまま）: {self.path}"
@@ -0,0 +1,126 @@
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+# ホストごとのアクセス間隔を自動で調整するペース配分（AIMD: 加算的増加・乗算的減少）
+#
+# - 取得に成功するたびに、速度（1秒あたりのリクエスト数）を increase ずつ上げる
+# - チャレンジページ（403/429/503 を含む）や接続エラー・タイムアウトが出たら、速度を decrease 倍に落とす
+# - 応答時間がそのホストのいつもの値（これまでの最小の移動平均）の latency_factor 倍を超えたら、混雑の目印として少し落とす
+# 間隔は必ず [min_interval, max_interval] に収めます。全ワーカーで1つを共有し、同じホストへのリクエストは
+# 「今の間隔」に1回まで（± jitter の揺らぎつき）。学習した間隔は state_file に保存して、次回の実行（01・02 共通）に引き継ぎます。
+
+LATENCY_SMOOTHING = 0.3   # 応答時間の移動平均の重み
+LATENCY_MARGIN = 0.5      # 「いつもより遅い」とみなすには、いつもの値より最低この秒数は遅いこと（小さな揺れは無視）
+SLOWDOWN_FACTOR = 1.25    # 応答が遅くなった時に間隔を何倍にするか
+SAVE_EVERY = 10           # この回数の更新ごとに保存する（速度を落とした時はすぐ保存）
+
+
+class AdaptivePacer:
+    def __init__(self, min_interval, max_interval, start_interval=None, state_file=None,
+                 increase=0.02, decrease=0.5, latency_factor=2.0, jitter=0.2):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.start_interval = start_interval if start_interval is not None else max_interval
+        self.state_file = state_file
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.next_slot = {}
+        self.updates = 0
+        self.hosts = self._load()
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ ペース配分の学習結果が読めないため初期値から始めます: {e}")
+            return {}
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {'interval': self.start_interval, 'latency': {}}
+        # 設定した範囲が前回と変わっていても、必ず範囲内から始める
+        state['interval'] = self._clamp(state['interval'])
+        return state
+
+    def interval(self, url):
+        with self.lock:
+            return self._state(urlparse(url).netloc)['interval']
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            interval = self._state(host)['interval']
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        delay = slot - time.monotonic()
+        if delay > 0:
+            metrics.observe('throttle.wait', delay)
+            time.sleep(delay)
+
+    def record(self, url, engine, latency=None, ok=True, challenge=False):
+        # 1回の取得の結果を伝える（engine ごとに応答時間の「いつもの値」を持つ。HTTP と Chrome では桁が違うため）
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self._state(host)
+            before = state['interval']
+            if challenge or not ok:
+                state['interval'] = self._clamp(before / self.decrease)
+                # 次のリクエストも新しい間隔だけ空ける
+                self.next_slot[host] = max(self.next_slot.get(host, 0), time.monotonic() + state['interval'])
+                metrics.count('pacing.challenge' if challenge else 'pacing.error')
+            elif latency is not None and self._is_slow(state, engine, latency):
+                state['interval'] = self._clamp(before * SLOWDOWN_FACTOR)
+                metrics.count('pacing.slow')
+            else:
+                # 速度 1/間隔 に increase を足す（= 間隔 / (1 + increase × 間隔)。間隔 0 でも割り算にならない形）
+                state['interval'] = self._clamp(before / (1 + self.increase * before))
+            state['updated_at'] = time.time()
+            self.updates += 1
+            backed_off = state['interval'] > before
+            should_save = backed_off or self.updates % SAVE_EVERY == 0
+        if backed_off:
+            print(f"  -> 🐢 アクセス間隔を {before:.1f}秒 → {state['interval']:.1f}秒 に広げます ({host})")
+        if should_save:
+            self.save()
+
+    def _is_slow(self, state, engine, latency):
+        stats = state['latency'].setdefault(engine, {})
+        ewma = stats.get('ewma')
+        ewma = latency if ewma is None else (1 - LATENCY_SMOOTHING) * ewma + LATENCY_SMOOTHING * latency
+        stats['ewma'] = ewma
+        stats['baseline'] = min(stats.get('baseline', ewma), ewma)
+        stats['samples'] = stats.get('samples', 0) + 1
+        threshold = max(stats['baseline'] * self.latency_factor, stats['baseline'] + LATENCY_MARGIN)
+        return stats['samples'] >= 3 and ewma > threshold
+
+    def save(self):
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_path = self.state_file + '.tmp'
+        with self.lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.hosts, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.state_file)
+
+    def summary(self):
+        with self.lock:
+            parts = [f"{host} {state['interval']:.1f}秒" for host, state in self.hosts.items()]
+        return "ペース配分: " + (" / ".join(parts) if parts else "記録なし")
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 取得済みページHTMLのディスクキャッシュ（URLがキー）
+#
+# 本文は内容の sha256 をファイル名にして objects/ 以下に gzip で保存し（同じ内容は1つだけ）、
+# index.json に URL ごとの 状態(status)・取得時刻・本文ハッシュ を記録します。
+# 1ページ取得するたびに index.json を書き換えるので、途中で落ちても取得済みの分は残ります。
+
+STATUS_OK = 'ok'        # 問題文まで取れた
+STATUS_EMPTY = 'empty'  # ページは取れたが問題文が見つからなかった（次回また取りに行く）
+STATUS_ERROR = 'error'  # 取得エラー（次回また取りに行く）
+
+
+class PageCache:
+    def __init__(self, root, ttl_days=None, force_refresh=False):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.json')
+        # ttl_days: None = 期限なし / 数値 = その日数より古いページは取り直す
+        self.ttl_seconds = ttl_days * 86400 if ttl_days is not None else None
+        # force_refresh: True = キャッシュを無視して全ページ取り直す（結果はキャッシュに保存）
+        self.force_refresh = force_refresh
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ キャッシュの索引が読めないため作り直します: {e}")
+            return {}
+
+    def _save_index(self):
+        # 書き込み途中で落ちても索引が壊れないよう、一時ファイル経由で置き換える
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash + '.html.gz')
+
+    def entry(self, url):
+        with self.lock:
+            return self.index.get(url)
+
+    def is_fresh(self, url):
+        entry = self.entry(url)
+        if self.force_refresh or not entry or entry.get('status') != STATUS_OK:
+            return False
+        if self.ttl_seconds is not None and time.time() - entry['fetched_at'] > self.ttl_seconds:
+            return False
+        return os.path.exists(self._object_path(entry['sha256']))
+
+    def get(self, url):
+        entry = self.entry(url)
+        if not entry or not entry.get('sha256'):
+            return None
+        try:
+            with gzip.open(self._object_path(entry['sha256']), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, url, html, status=STATUS_OK):
+        content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        path = self._object_path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+
+        with self.lock:
+            self.index[url] = {
+                'status': status,
+                'sha256': content_hash,
+                'fetched_at': time.time(),
+                'size': len(html),
+            }
+            self._save_index()
+
+    def mark_error(self, url, error):
+        with self.lock:
+            entry = dict(self.index.get(url) or {})
+            # 以前取れていた本文のハッシュは残しておく（状態だけ error にする）
+            entry.update({'status': STATUS_ERROR, 'error': str(error)[:500], 'failed_at': time.time()})
+            self.index[url] = entry
+            self._save_index()
+
+    def summary(self, urls):
+        fresh = sum(1 for url in urls if self.is_fresh(url))
+        return fresh, len(urls) - fresh
@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 段（ステージ）をつなげた並列パイプライン
+#
+#   source -> [段1: N1スレッド] -> [段2: N2スレッド] -> ... -> 呼び出し側
+#
+# 段と段の間は大きさに上限のあるキューでつながっていて、下流が詰まると上流の put() が待たされる（背圧）。
+# そのため、どこか1つの段が遅くても、メモリに溜まる件数は queue_size × 段数 程度で頭打ちになる。
+# 各段の関数は1件ずつ受け取る（batch_size > 1 の段は、その時キューにある分をまとめてリストで受け取り、リストで返す）。
+# 出てくる順番は入力順とは限らないので、順番が必要なら item に連番を持たせておくこと。
+
+_END = object()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, batch_size=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+
+
+class CpuPool:
+    # CPUを使う処理（HTMLの解析など）を別プロセスで動かすためのプール
+    # 最初に使われた時にプロセスを起動する（使わなければ起動しない）
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def run(self, fn, *args):
+        return self._start().submit(fn, *args).result()
+
+    def map(self, fn, items):
+        # items（リスト）をプロセスの数に分けてまとめて渡し、結果を元の順番で返す（1件ずつ送るより受け渡しが少ない）
+        workers = self.workers or os.cpu_count() or 1
+        return list(self._start().map(fn, items, chunksize=max(1, len(items) // workers)))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def _take_batch(q_in, batch_size):
+    # 1件目は来るまで待ち、残りは今キューにある分だけ取る
+    first = q_in.get()
+    if first is _END:
+        return None
+    items = [first]
+    while len(items) < batch_size:
+        try:
+            item = q_in.get_nowait()
+        except queue.Empty:
+            break
+        if item is _END:
+            q_in.put(_END)
+            break
+        items.append(item)
+    return items
+
+
+def run_pipeline(source, stages, queue_size=32):
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    errors = []
+    stop = threading.Event()
+
+    def feed():
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                queues[0].put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            queues[0].put(_END)
+
+    def work(stage, q_in, q_out, remaining, lock):
+        while True:
+            items = _take_batch(q_in, stage.batch_size)
+            if items is None:
+                # 同じ段の他のスレッドにも終わりを知らせる
+                q_in.put(_END)
+                break
+            if stop.is_set():
+                continue
+            try:
+                results = stage.fn(items) if stage.batch_size > 1 else [stage.fn(items[0])]
+                for result in results:
+                    q_out.put(result)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            q_out.put(_END)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for i, stage in enumerate(stages):
+        remaining = [stage.workers]
+        lock = threading.Lock()
+        for n in range(stage.workers):
+            threads.append(threading.Thread(
+                target=work, args=(stage, queues[i], queues[i + 1], remaining, lock),
+                name=f"{stage.name}-{n}", daemon=True,
+            ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                break
+            yield item
+    finally:
+        stop.set()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,228 @@
+import json
+import os
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+import metrics
+
+# 問題カード（02_scrape_raw.py が出力する <div class="question-card">）から、
+# 教材生成に必要な情報を取り出して1件のレコード(dict)にまとめる
+#
+# レコードの形式（JSONL の1行）:
+#   schema           : int   レコード形式のバージョン
+#   num              : int   問題番号（取れなかった場合は UNKNOWN_NUM = 9999）
+#   url              : str   元のディスカッションページ（取れなかった場合は "#"）
+#   suggested_answer : str   サイト解答（なければ "-"）
+#   votes            : list  コミュニティ投票 [{"choice": "A", "percent": 67, "votes": 12 or None}, ...]（多い順）
+#   has_body         : bool  問題本文が見つかったか
+#   stem             : str   問題文（p.card-text のテキスト）
+#   choices          : list  選択肢 [{"letter": "A.", "text": "...", "css": "multi-choice-item"}, ...]
+#   en_html          : str   不要要素を取り除いた英語原文のHTML
+#   ai_text          : str   AI に渡す問題文（改行区切りのテキスト）
+
+SCHEMA_VERSION = 1
+UNKNOWN_NUM = 9999  # 問題番号が取れなかったカード（エラーのカードなど）
+
+# HTMLパーサー: 'lxml'（C実装で速い）/ 'html.parser'（標準ライブラリ）/ 'auto'（lxml があれば lxml）
+PARSERS = ('lxml', 'html.parser')
+
+
+def resolve_parser(name='auto'):
+    if name != 'auto':
+        return name
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def make_soup(html, parser='auto'):
+    return BeautifulSoup(html, resolve_parser(parser))
+
+
+def prune_tree(root, remove_tag, remove_text=None):
+    # 木を1回だけたどって、remove_tag(tag) が真の要素を丸ごと削除し、remove_text(text) が真のテキストを空にする
+    # （削除する要素の中はたどらない。削除は走査が終わってからまとめて行う）
+    tags, texts = [], []
+    stack = list(reversed(root.contents))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NavigableString):
+            if remove_text and remove_text(node):
+                texts.append(node)
+            continue
+        if remove_tag(node):
+            tags.append(node)
+            continue
+        stack.extend(reversed(node.contents))
+    for tag in tags:
+        tag.decompose()
+    for text in texts:
+        text.replace_with("")
+
+
+def parse_votes(card):
+    # 投票情報の詳細を取得（display:none を除外）
+    votes = []
+    for bar in card.find_all('div', class_='vote-bar'):
+        # display: none の要素はスキップ
+        style_attr = bar.get('style', '')
+        if 'display: none' in style_attr or 'display:none' in style_attr:
+            continue
+
+        vote_text = bar.get_text(strip=True)
+        if vote_text and '(' in vote_text and ')' in vote_text:
+            # "A (100%)" のような形式から抽出
+            match = re.match(r'([A-Z]+)\s*\((\d+)%\)', vote_text)
+            if match:
+                # 投票数を取得
+                votes_attr = bar.get('data-original-title', '')
+                votes_match = re.search(r'(\d+)\s*vote', votes_attr)
+                votes.append({
+                    'choice': match.group(1),
+                    'percent': int(match.group(2)),
+                    'votes': int(votes_match.group(1)) if votes_match else None,
+                })
+    return votes
+
+
+# カード本文から取り除くもの
+# ① 解答・投票エリア（script/style/button/div のうち、このクラスを持つもの）
+TRASH_TAGS = {'script', 'style', 'button', 'div'}
+TRASH_CLASSES = {'question-answer', 'voting-summary', 'vote-bar'}
+# ② 投票バッジ（Most Votedなど）
+BADGE_TAGS = {'span', 'div'}
+BADGE_CLASSES = {'badge', 'most-voted-answer-badge', 'vote-distribution-bar', 'voted-answers-tally'}
+
+
+def is_card_trash(tag):
+    classes = tag.get('class') or ()
+    if tag.name in TRASH_TAGS and not TRASH_CLASSES.isdisjoint(classes):
+        return True
+    return tag.name in BADGE_TAGS and not BADGE_CLASSES.isdisjoint(classes)
+
+
+def clean_question_body(q_body_div):
+    # ①② の要素を削除し、③ "Most Voted" を含むテキストを空にする（1回の走査でまとめて行う）
+    prune_tree(q_body_div, is_card_trash, lambda text: "Most Voted" in text)
+
+
+def parse_question_card(card):
+    full_text = card.get_text(" ", strip=True)
+    suggested_match = re.search(r'Suggested Answer:\s*([A-Za-z]+)', full_text)
+
+    record = {
+        'schema': SCHEMA_VERSION,
+        'num': UNKNOWN_NUM,
+        'url': "#",
+        'suggested_answer': suggested_match.group(1) if suggested_match else "-",
+        'votes': parse_votes(card),
+        'has_body': False,
+        'stem': "",
+        'choices': [],
+        'en_html': "",
+        'ai_text': "",
+    }
+
+    header = card.find('div', class_='q-header')
+    if header:
+        m = re.search(r'Question\s+(\d+)', header.get_text())
+        if m: record['num'] = int(m.group(1))
+
+    link_tag = card.find('a', class_='source-link')
+    if link_tag:
+        record['url'] = link_tag['href']
+
+    q_body_div = card.find('div', class_='question-body') or card.find('div', class_='q-text')
+    if not q_body_div:
+        return record
+
+    clean_question_body(q_body_div)
+
+    # ④ きれいになった状態でテキストを取得する
+    record['has_body'] = True
+    record['ai_text'] = q_body_div.get_text("\n", strip=True)
+    record['en_html'] = str(q_body_div)
+
+    p_text = q_body_div.find('p', class_='card-text')
+    if p_text:
+        record['stem'] = p_text.get_text(strip=True)
+
+    for choice in q_body_div.find_all('li', class_='multi-choice-item'):
+        letter_span = choice.find('span', class_='multi-choice-letter')
+        letter = letter_span.get_text(strip=True) if letter_span else "●"
+        record['choices'].append({
+            'letter': letter,
+            'text': choice.get_text(" ", strip=True).replace(letter, "", 1).strip(),
+            'css': " ".join(choice.get('class', [])),
+        })
+
+    return record
+
+
+def parse_card_html(card_html, parser='auto'):
+    with metrics.timer('parse.card'):
+        card = make_soup(card_html, parser).find('div', class_='question-card')
+        return parse_question_card(card) if card is not None else None
+
+
+CARD_START = re.compile(r"""<div class=["']question-card["']""")
+
+
+def iter_card_html(path, chunk_size=1 << 16):
+    # 02 の出力HTMLを少しずつ読み、カード1枚分のHTMLずつ返す（ファイル全体をメモリに載せない）
+    # カードの区切りは <div class="question-card"> の開始タグ（02 はカードを入れ子にしない）
+    buffer = ""
+    start = None
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            search_from = 0 if start is None else start + 1
+            while True:
+                match = CARD_START.search(buffer, search_from)
+                if not match:
+                    break
+                if start is not None:
+                    yield buffer[start:match.start()]
+                # 前のカードを返したら、その分はバッファから捨てる
+                buffer = buffer[match.start():]
+                start = 0
+                search_from = 1
+            if start is None:
+                # まだカードが始まっていない（ヘッダー部分）。開始タグが途中で切れている可能性の分だけ残す
+                buffer = buffer[-64:]
+            if not chunk:
+                break
+    if start is not None:
+        yield buffer[start:]
+
+
+def write_question_store(path, records):
+    # 書き込み途中のファイルを 03 が読まないよう、一時ファイル経由で置き換える
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+
+def read_question_store(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get('schema') != SCHEMA_VERSION:
+                    raise ValueError(f"問題ストアの形式が古いです (schema={record.get('schema')})")
+                yield record
+
+
+def is_store_fresh(store_path, html_path):
+    # 問題ストアが出力HTMLと同じか新しければ、HTMLを解析し直さずにストアを使う
+    if not os.path.exists(store_path):
+        return False
+    if not os.path.exists(html_path):
+        return True
+    return os.path.getmtime(store_path) >= os.path.getmtime(html_path)
@@ -0,0 +1,337 @@
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from browser import BrowserSession
+from fragment_cache import pending_fragments
+from pacing import AdaptivePacer
+from page_cache import PageCache
+
+# 01 → 02 → 03 をまとめて実行するランナー（定期的な更新向け）
+#
+#   python3 run_all.py              # 必要な段だけ実行する
+#   python3 run_all.py --dry-run    # どの段を実行するか（理由つき）を表示するだけ
+#   python3 run_all.py --force 03   # 指定した段は変更がなくても実行する（段を書かなければ全段）
+#
+# 各段（Task）は入力ファイルと出力ファイルを持つ DAG の節点です。段を実行する前に
+#   段のスクリプトと、それが import しているこのフォルダーのモジュールのソース
+#   入力ファイルの内容（sha256）と、接続先の環境変数（ENV_KEYS）
+# から指紋を作り、前回成功した時の指紋と同じで出力ファイルもそろっていれば、その段は実行しません。
+# 上流の段を実行しても出力の内容が変わらなければ下流の指紋も変わらないので、下流は実行されません。
+# 入力ファイルのない 01 は URL_REFRESH_HOURS の間だけ、02 はページキャッシュの期限（CACHE_TTL_DAYS）の間だけ新しいとみなします。
+# 指紋が同じでも、02 は取得に失敗した（エラー・問題文なし）ページが残っていれば、03 は翻訳・AI解説の失敗などで
+# 保存しなかったカードが残っていれば、次の実行でもう一度実行します（失敗したページ・カードだけが作り直されます）。
+#
+# 01 と 02 を両方実行する時は、01 が新しいURLを見つけた時点で 02 のワーカーに渡して取得を始めます（OVERLAP_FETCH）。
+# 取得したページはページキャッシュに入るだけなので、01 の後に実行する 02 はキャッシュから読み、出力は順番に実行した時と同じです。
+# アクセス間隔（pacing.AdaptivePacer）は全段で1つを共有します。Chrome（browser.BrowserSession）は 01 の1台を 02 の最初のワーカーが
+# 引き継ぎ、他のワーカーはそれぞれ自分の Chrome を使います。
+
+# --- 設定 ---
+STATE_FILE = '.cache/run_all.json'  # 各段の指紋・出力・実行時刻の記録
+URL_REFRESH_HOURS = 12              # 01 は前回の実行からこの時間が経つまで実行しない（None = 毎回実行）
+OVERLAP_FETCH = True                # True = 01 の実行中に、見つかったURLから 02 の取得を始める
+ENV_KEYS = ('EXAMTOPICS_BASE_URL', 'GEMINI_BASE_URL')  # 指紋に入れる環境変数（接続先が変われば実行し直す）
+# ------------
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    # 01_/02_/03_ は数字で始まるので import 文では読み込めない
+    name = 'run_' + os.path.splitext(filename)[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def local_sources(filename, found=None):
+    # スクリプトと、そこから（間接的にも）import しているこのフォルダーの .py ファイル
+    found = set() if found is None else found
+    path = os.path.join(HERE, filename)
+    if filename in found or not os.path.exists(path):
+        return found
+    found.add(filename)
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_sources(name.split('.')[0] + '.py', found)
+    return found
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 実行の記録が読めないため全段を実行します: {e}")
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE) or '.', exist_ok=True)
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, STATE_FILE)
+
+
+class Task:
+    # inputs / outputs / max_age / dirty は読み込んだスクリプト（module）を受け取る関数（設定のファイル名を使うため）
+    #   max_age: 前回の実行からこの秒数が経ったら、指紋が同じでも実行する（None = 期限なし）
+    #   dirty  : 実行しなければならない理由があれば文字列で返す（なければ None）
+    def __init__(self, name, script, deps=(), inputs=None, outputs=None, max_age=None, dirty=None):
+        self.name = name
+        self.script = script
+        self.deps = deps
+        self.inputs = inputs or (lambda m: [])
+        self.outputs = outputs or (lambda m: [])
+        self.max_age = max_age or (lambda m: None)
+        self.dirty = dirty or (lambda m: None)
+        self.module = None
+
+    def load(self):
+        if self.module is None:
+            self.module = load_script(self.script)
+        return self.module
+
+    def fingerprint(self):
+        m = self.load()
+        data = {
+            'code': {path: file_digest(os.path.join(HERE, path)) for path in sorted(local_sources(self.script))},
+            'inputs': {path: file_digest(path) for path in self.inputs(m)},
+            'env': {key: os.getenv(key) for key in ENV_KEYS},
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def stale_reason(self, record):
+        # 実行が必要なら理由を返す（None = 前回の結果のままでよい）
+        m = self.load()
+        if record is None:
+            return "初回"
+        if record['fingerprint'] != self.fingerprint():
+            return "入力かスクリプトが変わった"
+        missing = [path for path in self.outputs(m) if not os.path.exists(path)]
+        if missing:
+            return f"出力がない（{missing[0]}）"
+        max_age = self.max_age(m)
+        age = time.time() - record['finished_at']
+        if max_age is not None and age >= max_age:
+            return f"前回の実行から {age / 3600:.1f} 時間経過"
+        return self.dirty(m)
+
+
+def scrape_dirty(m2):
+    if m2.FORCE_REFRESH:
+        return "FORCE_REFRESH = True"
+    if not os.path.exists(m2.INPUT_FILE):
+        return None
+    # エラーのカードになったページ（STATUS_ERROR / STATUS_EMPTY）や、まだ取得していないページ
+    cache = PageCache(m2.CACHE_DIR, ttl_days=m2.CACHE_TTL_DAYS)
+    _, fetch_count = cache.summary(m2.read_urls(m2.INPUT_FILE))
+    return f"取得できていないページが {fetch_count} 件ある" if fetch_count else None
+
+
+def generate_dirty(m3):
+    if os.path.exists(m3.AI_BATCH_STATE_FILE):
+        return "バッチジョブの結果待ち"
+    pending = pending_fragments(m3.FRAGMENT_CACHE_DIR)
+    return f"作り直しが必要なカードが {len(pending)} 問ある（翻訳・AI解説の失敗など）" if pending else None
+
+
+def build_tasks():
+    return [
+        Task('01', '01_fetch_urls.py',
+             outputs=lambda m: [m.output_filename(exam) for exam in m.TARGET_EXAMS],
+             max_age=lambda m: URL_REFRESH_HOURS * 3600 if URL_REFRESH_HOURS is not None else 0),
+        Task('02', '02_scrape_raw.py', deps=('01',),
+             inputs=lambda m: [m.INPUT_FILE],
+             outputs=lambda m: [m.OUTPUT_FILE, m.QUESTIONS_FILE],
+             max_age=lambda m: m.CACHE_TTL_DAYS * 86400 if m.CACHE_TTL_DAYS is not None else None,
+             dirty=scrape_dirty),
+        Task('03', '03_generate_study_kit.py', deps=('02',),
+             inputs=lambda m: [m.QUESTIONS_FILE, m.INPUT_FILE, m.AI_BATCH_RESULTS_FILE],
+             outputs=lambda m: [m.OUTPUT_HTML] + ([m.NOTEBOOK_FILE] if m.NOTEBOOK_FILE else []),
+             dirty=generate_dirty),
+    ]
+
+
+class Prefetcher:
+    # 01 が見つけたURLを 02 の ScrapePool で先に取得し、ページキャッシュに入れておく
+    def __init__(self, m2, pacer, browser):
+        self.cache = PageCache(m2.CACHE_DIR, ttl_days=m2.CACHE_TTL_DAYS)
+        self.pool = m2.ScrapePool(m2.WORKERS, pacer, self.cache, m2.FETCH_ENGINE, browser)
+        self.executor = ThreadPoolExecutor(max_workers=m2.WORKERS)
+        self.futures = []
+        self.seen = set()
+
+    def submit(self, urls):
+        for url in urls:
+            if url in self.seen or self.cache.is_fresh(url):
+                continue
+            self.seen.add(url)
+            self.futures.append(self.executor.submit(self.pool.fetch, 0, url))
+
+    def finish(self):
+        # 取得の失敗は 02 が取り直すので、ここでは数えるだけ
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+        errors = sum(1 for future in self.futures if future.exception() is not None)
+        return len(self.futures), errors
+
+
+class Runner:
+    def __init__(self, tasks, force=(), dry_run=False):
+        self.tasks = tasks
+        self.by_name = {task.name: task for task in tasks}
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = load_state()
+        self.results = {}  # 段の名前 -> 'ran' / 'skipped' / 'failed' / 'planned'（--dry-run）
+        self.browser = None
+        self.pacer = None
+
+    def reason(self, task):
+        if task.name in self.force:
+            return "指定により実行"
+        reason = task.stale_reason(self.state.get(task.name))
+        pending = [dep for dep in task.deps if self.results.get(dep) == 'planned']
+        if reason is None and pending:
+            # --dry-run では上流を実行しないので、上流の出力次第としか言えない
+            return f"上流（{', '.join(pending)}）の出力が変わった場合"
+        return reason
+
+    def shared(self):
+        # 引き継ぎ用の Chrome とアクセス間隔は 01 の設定で1つだけ作り、全段で使う
+        if self.browser is None:
+            m1 = self.by_name['01'].load()
+            self.pacer = AdaptivePacer(m1.PACING_MIN_INTERVAL, m1.PACING_MAX_INTERVAL, m1.PACING_START_INTERVAL, m1.PACING_STATE_FILE)
+            self.browser = BrowserSession(m1.BROWSER_STATE_DIR, keep_alive=False)
+        return self.browser, self.pacer
+
+    def run_01(self, m1):
+        browser, pacer = self.shared()
+        m2 = self.by_name['02'].load()
+        prefetcher = None
+        if OVERLAP_FETCH and not m2.FORCE_REFRESH:
+            prefetcher = Prefetcher(m2, pacer, browser)
+        # 02 が読むURLリストの試験のリンクだけを先に取得する
+        exams = {exam for exam in m1.TARGET_EXAMS if m1.output_filename(exam) == m2.INPUT_FILE}
+
+        def on_new_links(exam, urls):
+            if exam in exams:
+                prefetcher.submit(urls)
+
+        try:
+            m1.main(browser=browser, pacer=pacer, on_new_links=on_new_links if prefetcher else None)
+        finally:
+            if prefetcher:
+                fetched, errors = prefetcher.finish()
+                if fetched:
+                    print(f"⏩ 01 の実行中に 02 の問題ページを先に取得しました: {fetched} 件（失敗 {errors} 件は 02 で取り直します）")
+
+    def run_02(self, m2):
+        browser, pacer = self.shared()
+        m2.main(browser=browser, pacer=pacer)
+
+    def run_03(self, m3):
+        m3.main()
+
+    def run(self):
+        started = time.time()
+        summary = []
+        try:
+            for task in self.tasks:
+                if any(self.results.get(dep) == 'failed' for dep in task.deps):
+                    self.results[task.name] = 'failed'
+                    summary.append(f"  ⏭️ {task.name}: 上流が失敗したため実行しません")
+                    continue
+                reason = self.reason(task)
+                if reason is None:
+                    self.results[task.name] = 'skipped'
+                    summary.append(f"  💤 {task.name}: 変更なし（前回の結果を使います）")
+                    print(f"💤 [{task.name}] {task.script}: 入力・スクリプトとも変更なしのため実行しません")
+                    continue
+                if self.dry_run:
+                    self.results[task.name] = 'planned'
+                    summary.append(f"  ▶️ {task.name}: 実行します（{reason}）")
+                    continue
+
+                print(f"\n▶️ [{task.name}] {task.script} を実行します（{reason}）")
+                task_started = time.time()
+                try:
+                    getattr(self, 'run_' + task.name)(task.load())
+                except Exception as e:
+                    print(f"❌ [{task.name}] でエラーが発生しました: {e}")
+                    self.results[task.name] = 'failed'
+                    summary.append(f"  ❌ {task.name}: 失敗（{e}）")
+                    continue
+                seconds = time.time() - task_started
+                missing = [path for path in task.outputs(task.module) if not os.path.exists(path)]
+                if missing:
+                    self.results[task.name] = 'failed'
+                    summary.append(f"  ❌ {task.name}: 出力ができませんでした（{missing[0]}）")
+                    continue
+                # 指紋は実行後の入力で作る（実行中に入力が書き換わる段もあるため）
+                self.state[task.name] = {
+                    'fingerprint': task.fingerprint(),
+                    'outputs': {path: file_digest(path) for path in task.outputs(task.module)},
+                    'finished_at': time.time(),
+                    'seconds': round(seconds, 1),
+                }
+                save_state(self.state)
+                self.results[task.name] = 'ran'
+                summary.append(f"  ✅ {task.name}: 実行 {seconds:.1f}秒（{reason}）")
+        finally:
+            if self.browser is not None:
+                self.browser.close()
+                self.pacer.save()
+
+        title = "実行予定" if self.dry_run else f"完了 {time.time() - started:.1f}秒"
+        print(f"\n🧭 run_all: {title}")
+        print("\n".join(summary))
+        return all(result != 'failed' for result in self.results.values())
+
+
+def main(argv):
+    dry_run = '--dry-run' in argv
+    names = [arg for arg in argv if not arg.startswith('--')]
+    tasks = build_tasks()
+    if '--force' in argv:
+        force = names or [task.name for task in tasks]
+    else:
+        force = []
+    unknown = [name for name in force if name not in {task.name for task in tasks}]
+    if unknown:
+        print(f"❌ 段の名前は 01 / 02 / 03 のどれかです: {', '.join(unknown)}")
+        return False
+    return Runner(tasks, force=force, dry_run=dry_run).run()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
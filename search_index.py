@@ -0,0 +1,154 @@
+import html
+import json
+import os
+import re
+import unicodedata
+
+# 教科書の検索用の転置インデックス（03 の生成時に作り、出力と一緒に置く）
+#
+# 問題文・選択肢の英語と日本語訳を単語に分けて「語 -> その語を含む問題」の表を作ります。
+#   英数字       : 2文字以上の単語（小文字・全角は半角に揃える）
+#   日本語(かな漢字): 連続する部分を2文字ずつ（bi-gram）に区切る。形態素解析の辞書なしで部分一致できる
+# ページ側では入力した語を同じ規則で区切り、全部を含む問題（英数字は前方一致）を表から引くので、
+# 本文（DOM）を検索することはありません。⚠️/🤔/✅ で絞り込むこともできます。
+#
+#   <出力ファイル名>_search.js : loadSearchIndex({"status": [...], "docs": [[問題番号, 状態], ...],
+#                                                 "terms": [語, ...], "postings": [[問題の位置の差分, ...], ...]})
+#   （file:// で開いても <script> で読み込めるように JSON を関数呼び出しで包む）
+
+STATUSES = ["✅", "🤔", "⚠️"]
+TERM_RE = re.compile(r'[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f]+')
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def tokenize(text):
+    terms = set()
+    for run in TERM_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if run.isascii():
+            if len(run) >= 2 or run.isdigit():
+                terms.add(run)
+        elif len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def html_text(fragment):
+    return html.unescape(TAG_RE.sub(' ', fragment))
+
+
+def card_entry(record, status_icon, jp_html):
+    # 1問分の索引の材料: 状態アイコンと、問題文・選択肢の英語と描画済みの日本語訳（jp_html）の語
+    texts = [record['stem']] + [choice['text'] for choice in record['choices']] + [html_text(jp_html)]
+    return {'status': status_icon, 'terms': sorted(set().union(*(tokenize(text) for text in texts)))}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.docs = []  # (問題番号, 並び順, 状態アイコン, 語のリスト)
+
+    def add(self, num, order, entry):
+        # entry: card_entry() の結果（差分ビルドで再利用するカードは保存済みのもの）
+        self.docs.append((num, order, entry['status'], entry['terms']))
+
+    def __len__(self):
+        return len(self.docs)
+
+    def build(self):
+        # カードと同じ問題番号順に並べ、語ごとに問題の位置（昇順）を差分で持つ
+        docs = sorted(self.docs, key=lambda doc: (doc[0], doc[1]))
+        postings = {}
+        for position, (_, _, _, terms) in enumerate(docs):
+            for term in terms:
+                postings.setdefault(term, []).append(position)
+        terms = sorted(postings)
+        deltas = []
+        for term in terms:
+            positions = postings[term]
+            deltas.append([positions[0]] + [b - a for a, b in zip(positions, positions[1:])])
+        return {
+            'status': STATUSES,
+            'docs': [[num, STATUSES.index(icon) if icon in STATUSES else 0] for num, _, icon, _ in docs],
+            'terms': terms,
+            'postings': deltas,
+        }
+
+    def write(self, path):
+        data = json.dumps(self.build(), ensure_ascii=False, separators=(',', ':'))
+        data = data.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"loadSearchIndex({data});\n")
+        os.replace(tmp_path, path)
+
+
+def index_path(output_html):
+    return os.path.splitext(output_html)[0] + '_search.js'
+
+
+def search_panel(output_html):
+    # 教科書の末尾に入れる検索欄（索引ファイルは出力HTMLと同じフォルダーから読み込む）
+    return SEARCH_PANEL.replace('SEARCH_INDEX_FILE', os.path.basename(index_path(output_html)))
+
+
+SEARCH_PANEL = """
+<div id="search-panel" style="position:fixed;top:10px;right:10px;z-index:20;width:260px;background:#fff;padding:10px;border-radius:8px;box-shadow:0 2px 8px rgba(0,0,0,.2);font-size:0.9em">
+    <input id="search-q" type="search" placeholder="🔍 キーワード（英語/日本語）" style="width:100%;box-sizing:border-box" oninput="runSearch()">
+    <div style="margin-top:5px">
+        <label><input type="checkbox" class="search-status" value="2" checked onchange="runSearch()">⚠️</label>
+        <label><input type="checkbox" class="search-status" value="1" checked onchange="runSearch()">🤔</label>
+        <label><input type="checkbox" class="search-status" value="0" checked onchange="runSearch()">✅</label>
+        <span id="search-count" style="color:#666;margin-left:5px"></span>
+    </div>
+    <div id="search-hits" style="max-height:50vh;overflow:auto;margin-top:5px;line-height:1.8"></div>
+</div>
+<script>
+var searchIndex = null;
+function loadSearchIndex(data) {
+    // 差分で持っている問題の位置を元に戻しておく
+    data.postings = data.postings.map(function(d) { var p = [], x = 0; d.forEach(function(v) { x += v; p.push(x); }); return p; });
+    searchIndex = data;
+    runSearch();
+}
+function searchTokens(text) {
+    var out = [], re = /[a-z0-9]+|[\\u3040-\\u30ff\\u3400-\\u9fff\\uf900-\\ufaff\\uff66-\\uff9f]+/g, m;
+    text = text.normalize('NFKC').toLowerCase();
+    while ((m = re.exec(text))) {
+        var run = m[0];
+        if (/^[a-z0-9]+$/.test(run) || run.length === 1) out.push({term: run, prefix: true});
+        else for (var i = 0; i + 2 <= run.length; i++) out.push({term: run.substr(i, 2), prefix: false});
+    }
+    return out;
+}
+function lookup(token) {
+    // 語の一覧は昇順なので、二分探索で最初の候補を探し、前方一致する語の問題をまとめる
+    var terms = searchIndex.terms, lo = 0, hi = terms.length, hits = {};
+    while (lo < hi) { var mid = (lo + hi) >> 1; if (terms[mid] < token.term) lo = mid + 1; else hi = mid; }
+    for (var i = lo; i < terms.length && terms[i].lastIndexOf(token.term, 0) === 0; i++) {
+        searchIndex.postings[i].forEach(function(p) { hits[p] = true; });
+        if (!token.prefix) break;
+    }
+    return hits;
+}
+function runSearch() {
+    if (!searchIndex) return;
+    var tokens = searchTokens(document.getElementById('search-q').value), allowed = {}, allOn = true;
+    Array.prototype.forEach.call(document.querySelectorAll('.search-status'), function(c) { allowed[c.value] = c.checked; allOn = allOn && c.checked; });
+    var sets = tokens.map(lookup), matches = [];
+    searchIndex.docs.forEach(function(doc, p) {
+        var ok = allowed[doc[1]] && sets.every(function(s) { return s[p]; });
+        if (ok) matches.push(doc);
+        // 1ファイル版では、条件に合わない問題のカードを隠す（ページ分割版では一覧から移動する）
+        var card = document.getElementById('q' + doc[0]);
+        if (card) card.style.display = ok ? '' : 'none';
+    });
+    var filtering = tokens.length || !allOn;
+    document.getElementById('search-count').innerText = filtering ? matches.length + ' 件' : '';
+    document.getElementById('search-hits').innerHTML = filtering ? matches.slice(0, 200).map(function(doc) {
+        return '<a href="#q' + doc[0] + '">Q' + doc[0] + ' ' + searchIndex.status[doc[1]] + '</a>';
+    }).join(' ') + (matches.length > 200 ? ' …' : '') : '';
+}
+</script>
+<script src="SEARCH_INDEX_FILE"></script>
+"""
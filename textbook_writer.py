@@ -0,0 +1,222 @@
+import json
+import os
+
+# 教科書HTMLの書き出し（カードを1枚ずつディスクに流し込む）
+#
+# カードは出来上がった順に「<出力ファイル>.part」へ追記して即 flush するので、
+# 途中で止まっても、そこまでのカードは .part ファイルで読めます。
+# メモリに持つのは (問題番号, 位置, 長さ) の小さな索引だけで、最後にこの索引を問題番号順に
+# 並べ替えて、.part から順番にコピーして完成版を作ります（すでに番号順なら追記だけで済ませる）。
+#
+# PagedSpool は同じように .part に溜めたカードを、最後に page_size 問ずつのデータファイル
+# （<出力ファイル名>_pages/page_0001.js …）に分け、出力ファイルには小さな「枠」のHTMLだけを書きます。
+# 枠はスクロールやページ移動に合わせて必要なページだけを読み込んで描画し、表示中のページは
+# MAX_LIVE_PAGES 枚までに保つので、問題数が増えても開く速さとブラウザのメモリはほぼ一定です。
+# データファイルは JSON を loadPage(...) で包んだ形（file:// で開いても <script> で読み込めるように）。
+
+
+class CardSpool:
+    def __init__(self, path, header, footer):
+        self.path = path
+        self.part_path = path + '.part'
+        self.footer = footer
+        self.index = []  # (問題番号, 並び順, 位置, バイト長)
+        self.file = open(self.part_path, 'wb')
+        self.file.write(header.encode('utf-8'))
+        self.header_length = self.file.tell()
+        self.file.flush()
+
+    def add(self, num, card_html, order=None):
+        # order: 同じ問題番号どうしの並び順（省略時は到着順）。並列処理では入力順の連番を渡す
+        data = card_html.encode('utf-8')
+        order = len(self.index) if order is None else order
+        self.index.append((num, order, self.file.tell(), len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+    def __len__(self):
+        return len(self.index)
+
+    def iter_cards(self):
+        # 問題番号順に (問題番号, カードのHTML) を返す（finish の前に file を閉じておくこと）
+        with open(self.part_path, 'rb') as src:
+            for num, _, offset, length in sorted(self.index):
+                src.seek(offset)
+                yield num, src.read(length).decode('utf-8')
+
+    def finish(self):
+        self.file.close()
+        ordered = sorted(self.index)
+
+        if ordered == self.index:
+            # すでに番号順: .part にフッターを足して名前を変えるだけ
+            with open(self.part_path, 'ab') as f:
+                f.write(self.footer.encode('utf-8'))
+            os.replace(self.part_path, self.path)
+            return
+
+        tmp_path = self.path + '.tmp'
+        with open(self.part_path, 'rb') as src, open(tmp_path, 'wb') as out:
+            out.write(src.read(self.header_length))
+            for _, _, offset, length in ordered:
+                src.seek(offset)
+                out.write(src.read(length))
+            out.write(self.footer.encode('utf-8'))
+        os.replace(tmp_path, self.path)
+        os.remove(self.part_path)
+
+
+MAX_LIVE_PAGES = 3
+
+PAGED_BODY = """
+<nav class="page-nav" style="position:sticky;top:0;z-index:10;background:#f0f2f5;padding:8px 0;text-align:center">
+    <button class="toggle-btn" onclick="textbook.step(-1)">◀ 前へ</button>
+    <select id="page-select" onchange="textbook.show(+this.value)"></select>
+    <button class="toggle-btn" onclick="textbook.step(1)">次へ ▶</button>
+</nav>
+<div id="page-top"></div><div id="cards"></div><div id="page-bottom" style="height:1px"></div>
+<script>
+var textbook = (function(data) {
+    var box = document.getElementById('cards'), select = document.getElementById('page-select');
+    var live = [], loading = {}, callbacks = {}, generation = 0;
+    data.pages.forEach(function(p, i) {
+        var o = document.createElement('option');
+        o.value = i; o.text = 'Q' + p.first + ' – Q' + p.last + ' (' + p.count + '問)';
+        select.appendChild(o);
+    });
+    window.loadPage = function(no, cards) { if (callbacks[no]) callbacks[no](cards); };
+    function fetchPage(no, done) {
+        if (no < 0 || no >= data.pages.length || loading[no] || live.indexOf(no) >= 0) return;
+        loading[no] = true;
+        var s = document.createElement('script'), current = generation;
+        callbacks[no] = function(cards) {
+            delete callbacks[no]; delete loading[no]; s.remove();
+            // 読み込み中に別のページへ移動していたら捨てる
+            if (current === generation) done(cards);
+        };
+        s.src = data.dir + data.pages[no].file;
+        document.head.appendChild(s);
+    }
+    function section(no, cards) {
+        var sec = document.createElement('section');
+        sec.dataset.page = no;
+        sec.innerHTML = cards.join('');
+        return sec;
+    }
+    function trim(fromTop) {
+        // 表示中のページは MAX_LIVE_PAGES 枚まで。読み込んだ側と反対の端から捨てる（位置がずれないよう補正）
+        while (live.length > data.maxLive) {
+            if (fromTop) {
+                var first = box.firstElementChild, h = first.offsetHeight;
+                box.removeChild(first); live.shift(); window.scrollBy(0, -h);
+            } else {
+                box.removeChild(box.lastElementChild); live.pop();
+            }
+        }
+    }
+    function append(no) {
+        fetchPage(no, function(cards) { box.appendChild(section(no, cards)); live.push(no); trim(true); });
+    }
+    function prepend(no) {
+        fetchPage(no, function(cards) {
+            var sec = section(no, cards);
+            box.insertBefore(sec, box.firstElementChild); live.unshift(no);
+            window.scrollBy(0, sec.offsetHeight); trim(false);
+        });
+    }
+    function show(no, num) {
+        generation++;
+        box.innerHTML = ''; live = []; loading = {};
+        select.value = no;
+        fetchPage(no, function(cards) {
+            box.appendChild(section(no, cards)); live.push(no);
+            var target = num != null && document.getElementById('q' + num);
+            if (target) target.scrollIntoView(); else window.scrollTo(0, box.offsetTop);
+        });
+    }
+    function pageOf(num) {
+        for (var i = 0; i < data.pages.length; i++) if (num <= data.pages[i].last) return i;
+        return data.pages.length - 1;
+    }
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting && live.length) append(live[live.length - 1] + 1);
+        }, {rootMargin: '800px 0px'}).observe(document.getElementById('page-bottom'));
+        new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting && live.length && live[0] > 0) prepend(live[0] - 1);
+        }).observe(document.getElementById('page-top'));
+    }
+    window.addEventListener('scroll', function() {
+        // 画面の上端にあるページを、ページ選択に反映する
+        var secs = box.children;
+        for (var i = 0; i < secs.length; i++) {
+            if (secs[i].getBoundingClientRect().bottom > 0) { select.value = secs[i].dataset.page; break; }
+        }
+    }, {passive: true});
+    window.addEventListener('hashchange', function() {
+        var h = /^#q(\\d+)$/.exec(location.hash);
+        if (h && !document.getElementById('q' + h[1])) show(pageOf(+h[1]), +h[1]);
+    });
+    var m = /^#q(\\d+)$/.exec(location.hash);
+    if (data.pages.length) show(m ? pageOf(+m[1]) : 0, m ? +m[1] : null);
+    return {
+        show: function(no) { show(no); },
+        step: function(d) { var no = +select.value + d; if (no >= 0 && no < data.pages.length) show(no); },
+        jump: function(num) { show(pageOf(num), num); }
+    };
+})(TEXTBOOK_DATA);
+</script>
+"""
+
+
+def js_json(value):
+    # U+2028/2029 は古いブラウザの JavaScript の文字列に直接書けないのでエスケープする
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+class PagedSpool(CardSpool):
+    def __init__(self, path, header, footer, page_size=50):
+        super().__init__(path, '', '')
+        self.page_header = header
+        self.page_footer = footer
+        self.page_size = page_size
+        base, _ = os.path.splitext(path)
+        self.pages_dir = base + '_pages'
+        self.pages = []
+
+    def _write_page(self, cards):
+        no = len(self.pages)
+        name = f"page_{no + 1:04d}.js"
+        path = os.path.join(self.pages_dir, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"loadPage({no},{js_json([html for _, html in cards])});\n")
+        os.replace(tmp_path, path)
+        self.pages.append({'file': name, 'first': cards[0][0], 'last': cards[-1][0], 'count': len(cards)})
+
+    def finish(self):
+        self.file.close()
+        os.makedirs(self.pages_dir, exist_ok=True)
+        cards = []
+        for num, html in self.iter_cards():
+            cards.append((num, html.strip()))
+            if len(cards) >= self.page_size:
+                self._write_page(cards)
+                cards = []
+        if cards:
+            self._write_page(cards)
+
+        # 前回の方がページ数が多かった場合の残りを消す
+        current = {page['file'] for page in self.pages}
+        for name in os.listdir(self.pages_dir):
+            if name.startswith('page_') and name.endswith('.js') and name not in current:
+                os.remove(os.path.join(self.pages_dir, name))
+
+        data = {'dir': os.path.basename(self.pages_dir) + '/', 'maxLive': MAX_LIVE_PAGES, 'pages': self.pages}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write(self.page_header)
+            out.write(PAGED_BODY.replace('TEXTBOOK_DATA', js_json(data)))
+            out.write(self.page_footer)
+        os.replace(tmp_path, self.path)
+        os.remove(self.part_path)
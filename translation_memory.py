@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+import metrics
+
+# 翻訳メモリ（一度翻訳した文は二度と翻訳APIに送らない）
+#
+# 「原文 × 翻訳先の言語」をキーに訳文をJSONファイルへ保存します。
+# 未翻訳の文は改行でつないで、なるべく少ない回数のリクエストでまとめて翻訳します。
+# （行数が合わない等でまとめ翻訳がうまくいかなかった場合は、1文ずつ翻訳し直します）
+
+
+class TranslationMemory:
+    def __init__(self, path, translator, target='ja', batch_chars=4500, request_interval=0.3):
+        self.path = path
+        self.translator = translator
+        self.target = target
+        self.batch_chars = batch_chars            # 1リクエストにまとめる最大文字数（Google翻訳の上限は5000文字）
+        self.request_interval = request_interval  # リクエストごとの待機（秒）
+        self.lock = threading.Lock()
+        self.lookups = 0   # 訳文を参照した文の数
+        self.misses = 0    # 翻訳APIに送った（メモリになかった）文の数
+        self.requests = 0  # 翻訳APIへのリクエスト回数
+        self.memory = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 翻訳メモリが読めないため作り直します: {e}")
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self.lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.memory, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def lookup(self, text):
+        with self.lock:
+            return self.memory.get(self.target, {}).get(text)
+
+    def _store(self, pairs):
+        with self.lock:
+            table = self.memory.setdefault(self.target, {})
+            for text, translated in pairs:
+                table[text] = translated
+
+    def _request(self, text):
+        with self.lock:
+            self.requests += 1
+        metrics.count('translate.chars', len(text))
+        with metrics.timer('translate.request'):
+            result = self.translator.translate(text)
+        metrics.observe('translate.interval', self.request_interval)
+        time.sleep(self.request_interval)
+        return result
+
+    def _translate_one_by_one(self, batch):
+        return [(text, self._request(text)) for text in batch]
+
+    def _translate_batch(self, batch):
+        # 改行を含む文はまとめると行がずれるので1文ずつ
+        if len(batch) == 1 or any('\n' in text for text in batch):
+            return self._translate_one_by_one(batch)
+
+        result = self._request("\n".join(batch))
+        lines = result.split("\n") if result else []
+        if len(lines) != len(batch):
+            return self._translate_one_by_one(batch)
+        return list(zip(batch, (line.strip() for line in lines)))
+
+    def _make_batches(self, texts):
+        batch, size = [], 0
+        for text in texts:
+            if batch and size + len(text) + 1 > self.batch_chars:
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + 1
+        if batch:
+            yield batch
+
+    def prefetch(self, texts):
+        # 未翻訳の文だけをまとめて翻訳してメモリに入れる（空文字は翻訳しない）
+        misses = []
+        seen = set()
+        for text in texts:
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            if self.lookup(text) is None:
+                misses.append(text)
+
+        with self.lock:
+            self.misses += len(misses)
+        for batch in self._make_batches(misses):
+            self._store(self._translate_batch(batch))
+            self.save()
+        return len(misses)
+
+    def translate_many(self, texts):
+        self.prefetch(texts)
+        results = []
+        for text in texts:
+            if not text:
+                results.append("")
+                continue
+            translated = self.lookup(text)
+            if translated is None:
+                raise RuntimeError(f"翻訳できませんでした: {text[:30]}")
+            results.append(translated)
+        with self.lock:
+            self.lookups += sum(1 for text in texts if text)
+        return results
+
+    def summary(self):
+        return f"翻訳メモリ: 参照 {self.lookups} 文 / 新規翻訳 {self.misses} 文 / 翻訳APIへのリクエスト {self.requests} 回"